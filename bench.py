@@ -0,0 +1,223 @@
+"""
+Benchmarks for the self-play hot path.
+
+Every workload is seeded, so runs on different commits measure the same
+work. Each reports operations per second (best of --repeat timed runs) and
+the peak memory traced by tracemalloc during one extra run.
+
+Usage:
+    python bench.py                          # run everything
+    python bench.py encode play_game         # run workloads matching a name
+    python bench.py --json after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import neat
+import numpy as np
+
+from main import AiEngine, ColumnsGame, CompiledNetwork, GameLogger, NetworkCache, legal_moves
+
+def random_positions(count, seed=0):
+    """
+    Plays seeded random legal moves to collect a spread of positions.
+    """
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        game = ColumnsGame()
+        for _ in range(rng.randrange(0, 60)):
+            legal = np.flatnonzero(legal_moves(game))
+            if len(legal) == 0:
+                break
+            game.apply_move(int(rng.choice(legal)))
+            game.current_player ^= 1
+        positions.append(game)
+    return positions
+
+def encode_state_legacy(game):
+    """
+    The original list-building encoder, kept as a baseline.
+    """
+    input_data = []
+    for column in game.board:
+        for level in range(game.stack_height):
+            if level < len(column.stack):
+                input_data.append(["", "Lr", "Lb", "Dr", "Db"].index(column.stack[level]))
+            else:
+                input_data.append(0)
+    for player in game.players:
+        for piece_type in ["roundels", "blockers", "d-blockers", "l-blockers"]:
+            input_data.append(game.pieces[player][piece_type])
+    return np.array(input_data)
+
+def make_genome(ai, key, num_hidden, connection_fraction=0.5):
+    """
+    A new genome with num_hidden hidden nodes and a seeded share of the
+    possible connections, so networks of different sizes can be timed.
+    """
+    genome_config = ai.config.genome_config
+    saved = genome_config.num_hidden, genome_config.initial_connection, genome_config.connection_fraction
+    genome_config.num_hidden = num_hidden
+    genome_config.initial_connection = "partial_nodirect"
+    genome_config.connection_fraction = connection_fraction
+    try:
+        genome = ai.config.genome_type(key)
+        genome.configure_new(genome_config)
+    finally:
+        genome_config.num_hidden, genome_config.initial_connection, genome_config.connection_fraction = saved
+    genome.fitness = 0
+    return genome
+
+def workloads(ai, seed):
+    """
+    Yields (name, ops, setup) for every benchmark. setup builds the seeded
+    inputs and returns a function doing ops operations per call, or
+    (prepare, run) where prepare is called untimed before every run and its
+    result is passed to run.
+    """
+    def process_move():
+        positions = random_positions(40, seed)
+        def prepare():
+            return [[game.clone() for _ in ai.all_moves] for game in positions]
+        def run(clones):
+            for games in clones:
+                for game, move in zip(games, ai.all_moves):
+                    game.process_move(move)
+        return prepare, run
+    yield "process_move (75 moves)", 40 * len(ai.all_moves), process_move
+
+    def encode(encoder):
+        def setup():
+            positions = random_positions(500, seed)
+            for game in positions:
+                assert (encode_state_legacy(game) == ai.encode_state(game)).all()
+            return lambda: [encoder(game) for game in positions]
+        return setup
+    buffer = np.empty(68)
+    yield "encode_state (legacy)", 500, encode(encode_state_legacy)
+    yield "encode_state", 500, encode(ai.encode_state)
+    yield "encode_state_into", 500, encode(lambda game: ai.encode_state_into(game, buffer))
+
+    def activate(num_hidden):
+        def setup():
+            random.seed(seed)
+            net = neat.nn.FeedForwardNetwork.create(make_genome(ai, 1, num_hidden), ai.config)
+            inputs = [ai.encode_state(game) for game in random_positions(20, seed)]
+            return lambda: [net.activate(x) for x in inputs]
+        return setup
+    for num_hidden in (0, 30, 120):
+        yield f"activate ({num_hidden} hidden)", 20, activate(num_hidden)
+
+    def play_game():
+        random.seed(seed)
+        genome1, genome2 = make_genome(ai, 1, 30), make_genome(ai, 2, 30)
+        net1 = neat.nn.FeedForwardNetwork.create(genome1, ai.config)
+        net2 = neat.nn.FeedForwardNetwork.create(genome2, ai.config)
+        return lambda: ai.play_game(genome1, net1, genome2, net2, 0, 0, {"moves": []})
+    yield "play_game", 1, play_game
+
+    def evaluate(verbosity):
+        def setup():
+            random.seed(seed)
+            genomes = [(key, make_genome(ai, key, 10, 0.2)) for key in range(1, 5)]
+            def prepare():
+                # Fresh caches, so every run builds and activates the networks
+                ai.networks = NetworkCache(ai.create_network)
+                ai.compiled_networks = NetworkCache(CompiledNetwork.create)
+            def run(_):
+                ai.settings.log_verbosity = verbosity
+                ai.logger = GameLogger(verbosity, ai.settings.log_sample_every)
+                ai.evaluate_genomes(genomes, ai.config)
+                ai.logger.flush()
+            return prepare, run
+        return setup
+    yield "evaluate_genomes (logging off)", 1, evaluate("off")
+    yield "evaluate_genomes (logging full)", 1, evaluate("full")
+
+def measure(ops, setup, repeat):
+    run = setup()
+    prepare = lambda: None
+    if isinstance(run, tuple):
+        prepare, run = run
+    else:
+        run = lambda _, timed=run: timed()
+    run(prepare())  # Warm up
+
+    best = float("inf")
+    for _ in range(repeat):
+        prepared = prepare()
+        started = time.perf_counter()
+        run(prepared)
+        best = min(best, time.perf_counter() - started)
+
+    prepared = prepare()
+    tracemalloc.start()
+    run(prepared)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"ops": ops, "seconds": best, "ops_per_sec": ops / best, "peak_kib": peak / 1024}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("names", nargs="*", help="only run workloads whose name contains one of these")
+    parser.add_argument("--config", default="config_file.txt")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per workload (best is kept)")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="results file from an earlier run to compare against")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    ai = AiEngine(args.config)
+    ai.settings.workers = 1
+    ai.settings.lockstep = False
+    ai.settings.profile = False
+    ai.profiler.enabled = False
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as compare_file:
+            previous = json.load(compare_file)["results"]
+
+    results = {}
+    cwd = os.getcwd()
+    # Evaluations write reports and genomes, so run in a scratch directory
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            print(f"{'workload':34} {'ops/sec':>12} {'peak KiB':>10}")
+            for name, ops, setup in workloads(ai, args.seed):
+                if args.names and not any(part in name for part in args.names):
+                    continue
+                result = measure(ops, setup, args.repeat)
+                results[name] = result
+                line = f"{name:34} {result['ops_per_sec']:12.1f} {result['peak_kib']:10.1f}"
+                if name in previous:
+                    line += f"   x{result['ops_per_sec'] / previous[name]['ops_per_sec']:.2f} vs {args.compare}"
+                print(line)
+        finally:
+            os.chdir(cwd)
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({
+                "seed": args.seed,
+                "repeat": args.repeat,
+                "python": sys.version.split()[0],
+                "numpy": np.__version__,
+                "platform": platform.platform(),
+                "results": results,
+            }, json_file, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
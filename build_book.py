@@ -0,0 +1,30 @@
+"""
+Builds an opening book from generation game records.
+
+Usage:
+    python build_book.py book.bin reports/generation_*.games --plies 8
+"""
+import argparse
+
+from main import GameRecordFile, OpeningBook, get_move_table
+
+def recorded_games(filenames, move_table):
+    for filename in filenames:
+        records = GameRecordFile(filename, move_table)
+        for game_number in records.game_numbers():
+            yield records.read(game_number)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output", help="opening book file to write")
+    parser.add_argument("records", nargs="+", help=".games files to collect openings from")
+    parser.add_argument("--plies", type=int, default=8, help="opening plies of each game to record")
+    args = parser.parse_args()
+
+    move_table = get_move_table()
+    book = OpeningBook.build(recorded_games(args.records, move_table), args.plies, move_table)
+    book.save(args.output)
+    print(f"{len(book)} book entries over the first {args.plies} plies")
+
+if __name__ == '__main__':
+    main()
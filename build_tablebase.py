@@ -0,0 +1,84 @@
+"""
+Builds an endgame tablebase from positions with few pieces left.
+
+Seed positions come from the given generation game records, or from
+seeded random games when none are given.
+
+Usage:
+    python build_tablebase.py endgame.tb --pieces 4 --games 500
+    python build_tablebase.py endgame.tb reports/generation_3.games ...
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from main import ColumnsGame, GameRecordFile, Tablebase, get_move_table, legal_moves
+
+def random_seeds(count, max_pieces, seed=0):
+    """
+    Plays seeded random legal games and keeps the first position of each
+    with at most max_pieces pieces left.
+    """
+    rng = random.Random(seed)
+    seeds = []
+    for _ in range(count):
+        game = ColumnsGame()
+        passes = 0
+        while passes < 2:
+            if sum(game.state.counts) <= max_pieces:
+                seeds.append(game.state)
+                break
+            legal = np.flatnonzero(legal_moves(game))
+            if len(legal) == 0:
+                passes += 1
+            else:
+                mover = game.current_player
+                game.apply_move(int(rng.choice(legal)))
+                passes = 0
+                if not any(game.pieces[game.players[mover]].values()):
+                    break
+            game.current_player ^= 1
+    return seeds
+
+def record_seeds(filename, max_pieces):
+    """
+    Replays every game in a .games file and keeps its first position with at
+    most max_pieces pieces left.
+    """
+    table = get_move_table()
+    records = GameRecordFile(filename, table)
+    seeds = []
+    for game_number in records.game_numbers():
+        game = ColumnsGame(move_table=table)
+        for ply_data in records.read(game_number)["moves"]:
+            if ply_data["move"] != "Pass":
+                game.apply_move(table.indices[ply_data["move"]])
+            game.current_player ^= 1
+            if sum(game.state.counts) <= max_pieces:
+                seeds.append(game.state)
+                break
+    return seeds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output", help="tablebase file to write")
+    parser.add_argument("records", nargs="*", help=".games files to take seed positions from")
+    parser.add_argument("--pieces", type=int, default=4, help="most unplaced pieces (both sides) to solve")
+    parser.add_argument("--games", type=int, default=500, help="random games to seed from when no records are given")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.records:
+        seeds = [state for filename in args.records for state in record_seeds(filename, args.pieces)]
+    else:
+        seeds = random_seeds(args.games, args.pieces, args.seed)
+
+    start = time.perf_counter()
+    tablebase = Tablebase.build(seeds, args.pieces)
+    tablebase.save(args.output)
+    print(f"{len(tablebase)} positions from {len(seeds)} seeds solved in {time.perf_counter() - start:.1f}s")
+
+if __name__ == '__main__':
+    main()
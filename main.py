@@ -1,9 +1,28 @@
+import argparse
+import atexit
+import configparser
+import copy
+import gzip
+import hashlib
 import itertools
+import json
+import multiprocessing
 import neat
 import numpy as np
 import os
 import pickle
+import queue
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict, namedtuple
+from collections.abc import Mapping
 from datetime import datetime
+from multiprocessing import resource_tracker, shared_memory
 
 def softmax(x):
     exp_x = np.exp(x - np.max(x))
@@ -19,38 +38,499 @@ def restricted_neighbors(n):
     
     return valid_neighbors
 
+# Piece codes used by the compact board; index 0 is an empty cell
+PIECES = ["", "Lr", "Lb", "Dr", "Db"]
+PIECE_CODES = {piece: code for code, piece in enumerate(PIECES)}
+PIECE_TYPES = ["roundels", "blockers", "d-blockers", "l-blockers"]
+NEIGHBORS = [restricted_neighbors(n) for n in range(12)]
+
+# Zobrist keys: one random 64-bit key per (cell, piece code), per (counter,
+# value) and for Dark to move. Empty cells key to 0, so the hash of a board
+# only involves the pieces on it. The fixed seed keeps hashes stable across
+# runs and processes.
+_zobrist_rng = np.random.default_rng(0x5A0B)
+ZOBRIST_CELLS = [[0] + [int(key) for key in _zobrist_rng.integers(1, 2**64, size=len(PIECES) - 1, dtype=np.uint64)] for _ in range(60)]
+ZOBRIST_COUNTS = [[int(key) for key in _zobrist_rng.integers(1, 2**64, size=256, dtype=np.uint64)] for _ in range(8)]
+ZOBRIST_DARK_TO_MOVE = int(_zobrist_rng.integers(1, 2**64, dtype=np.uint64))
+
+MOVES_FILE = "moves.txt"
+CONFIG_FILE = "config_file.txt"
+
+def find_data_file(name, explicit=None):
+    """
+    Resolves a data file: the explicit path if one is given, otherwise name
+    in the working directory, otherwise name next to this module.
+    """
+    if explicit:
+        return explicit
+    if os.path.exists(name):
+        return name
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+
+# A parsed line of moves.txt. Columns are zero-based, matching process_move.
+# kind indexes PIECE_TYPES and valid records whether the move passed every
+# check that does not depend on the board; for l-blockers, pair holds the
+# (doubled, single) columns whose heights are compared when it is played.
+Move = namedtuple("Move", ["index", "text", "kind", "cols", "valid", "pair"])
+
+def parse_move(index, text):
+    """
+    Parses a move string the way process_move does, running the board
+    independent checks once so they are not repeated every ply.
+    """
+    try:
+        parts = text.split(",")
+        move_type = parts[0].strip().lower()
+        cols = tuple(int(col.strip()) - 1 for col in parts[1:])
+    except ValueError:
+        return Move(index, text, -1, (), False, None)
+
+    if move_type == 'r':
+        kind = 0 if len(cols) == 1 else -1
+    elif move_type == 'b' and len(cols) in [1, 2, 3]:
+        kind = len(cols)
+    else:
+        kind = -1
+
+    valid = kind >= 0 and all(0 <= col <= 11 for col in cols)
+    pair = None
+
+    if valid and kind == 2:
+        valid = cols[0] != cols[1] and cols[0] in NEIGHBORS[cols[1]]
+    elif valid and kind == 3:
+        # Same arrangements as place_blocker, as (doubled, single) columns
+        for doubled, other, single in [(0, 1, 2), (1, 2, 0), (2, 0, 1)]:
+            if cols[doubled] == cols[other] and cols[doubled] in NEIGHBORS[cols[single]]:
+                pair = (cols[doubled], cols[single])
+                break
+        valid = pair is not None
+
+    return Move(index, text, kind, cols, valid, pair)
+
+class MoveTable:
+    """
+    Immutable table of the moves in moves.txt, parsed once, with the column
+    data laid out as arrays so legal-move masks can be computed in one step.
+    """
+    def __init__(self, moves):
+        self.moves = tuple(moves)
+        self.texts = tuple(move.text for move in self.moves)
+        self.indices = {move.text: move.index for move in self.moves}
+
+        size = len(self.moves)
+        self.kind = np.array([max(move.kind, 0) for move in self.moves], dtype=np.int64)
+        self.valid = np.array([move.valid for move in self.moves], dtype=bool)
+        self.cols = np.zeros((size, 3), dtype=np.int64)
+        self.num_cols = np.array([len(move.cols) if move.valid else 0 for move in self.moves], dtype=np.int64)
+        self.doubled = np.zeros(size, dtype=np.int64)
+        self.single = np.zeros(size, dtype=np.int64)
+
+        for i, move in enumerate(self.moves):
+            if move.valid:
+                # Unused slots repeat the first column so they never change the checks
+                self.cols[i] = (move.cols + (move.cols[0],) * 3)[:3]
+            if move.pair is not None:
+                self.doubled[i], self.single[i] = move.pair
+
+        for array in (self.kind, self.valid, self.cols, self.num_cols, self.doubled, self.single):
+            array.setflags(write=False)
+
+    @classmethod
+    def load(cls, filename=None):
+        with open(find_data_file(MOVES_FILE, filename), "r") as file:
+            return cls(parse_move(i, line.strip()) for i, line in enumerate(file.readlines()))
+
+    def __len__(self):
+        return len(self.moves)
+
+    def __getitem__(self, index):
+        return self.moves[index]
+
+    def legal_mask(self, heights, tops, counts, player):
+        """
+        Computes which moves are legal. Works on a single position or on a
+        batch, with heights and tops shaped (..., 12), counts (..., 8) and
+        player a scalar or shaped (...).
+
+        Returns:
+            A boolean array shaped (..., number of moves).
+        """
+        player = np.asarray(player)[..., None]
+        col_heights = heights[..., self.cols]
+
+        mask = self.valid & (col_heights < 5).all(axis=-1)
+        mask &= np.take_along_axis(counts, player * 4 + self.kind, axis=-1) > 0
+
+        # Roundels are blocked by an opposing blocker on top of the column
+        roundel_ok = tops[..., self.cols[:, 0]] != 4 - 2 * player
+        # D-blockers need two columns of equal height
+        d_ok = col_heights[..., 0] == col_heights[..., 1]
+        # L-blockers need room for three pieces and a single column level
+        # with, or one above, the doubled column
+        step = heights[..., self.single] - heights[..., self.doubled]
+        l_ok = (col_heights.sum(axis=-1) < 11) & ((step == 0) | (step == 1))
+
+        mask &= np.where(self.kind == 0, roundel_ok, True)
+        mask &= np.where(self.kind == 2, d_ok, True)
+        mask &= np.where(self.kind == 3, l_ok, True)
+        return mask
+
+_move_tables = {}
+
+def get_move_table(filename=None):
+    """
+    Returns the MoveTable for a moves file (by default moves.txt, found with
+    find_data_file), parsing it on first use only.
+    """
+    filename = find_data_file(MOVES_FILE, filename)
+    if filename not in _move_tables:
+        _move_tables[filename] = MoveTable.load(filename)
+    return _move_tables[filename]
+
+def legal_moves(game, table=None):
+    """
+    Returns a boolean mask over the move table marking the moves the current
+    player can make in the given ColumnsGame.
+    """
+    table = table if table is not None else game.move_table
+    state = game.state
+    heights = np.frombuffer(state.heights, dtype=np.uint8)
+    cells = np.frombuffer(state.cells, dtype=np.uint8).reshape(12, 5)
+    # Empty columns read their (empty) top cell, which is code 0 as well
+    tops = cells[np.arange(12), heights.astype(np.int64) - 1]
+    counts = np.frombuffer(state.counts, dtype=np.uint8)
+    return table.legal_mask(heights, tops, counts, state.current_player)
+
+class ColumnsState:
+    """
+    Compact board for the 12x5 game. Cells hold piece codes (see PIECES) with
+    five cells per column, heights holds each column's size and counts holds
+    the unplaced pieces as [Light roundels, blockers, d-blockers, l-blockers,
+    Dark roundels, blockers, d-blockers, l-blockers].
+
+    position_hash is a Zobrist hash of cells and counts (everything the
+    network sees) kept up to date as pieces are pushed and counters change;
+    zobrist_hash folds in the side to move.
+    """
+    __slots__ = ("cells", "heights", "counts", "score", "current_player", "position_hash")
+
+    stack_height = 5
+
+    def __init__(self):
+        self.cells = bytearray(60)
+        self.heights = bytearray(12)
+        self.counts = bytearray([12, 3, 3, 3, 12, 3, 3, 3])
+        self.score = [0, 0]
+        self.current_player = 0
+        self.position_hash = self.compute_position_hash()
+
+    @classmethod
+    def from_arrays(cls, cells, heights, counts, score, current_player):
+        state = cls()
+        state.cells[:] = bytes(np.asarray(cells, dtype=np.uint8))
+        state.heights[:] = bytes(np.asarray(heights, dtype=np.uint8))
+        state.counts[:] = bytes(np.asarray(counts, dtype=np.uint8))
+        state.score = [int(points) for points in score]
+        state.current_player = int(current_player)
+        state.position_hash = state.compute_position_hash()
+        return state
+
+    def compute_position_hash(self):
+        """
+        Recomputes position_hash from scratch.
+        """
+        position_hash = 0
+        for index, code in enumerate(self.cells):
+            position_hash ^= ZOBRIST_CELLS[index][code]
+        for index, count in enumerate(self.counts):
+            position_hash ^= ZOBRIST_COUNTS[index][count]
+        return position_hash
+
+    def compute_hash(self):
+        """
+        Recomputes zobrist_hash from scratch.
+        """
+        return self.compute_position_hash() ^ (ZOBRIST_DARK_TO_MOVE if self.current_player else 0)
+
+    @property
+    def zobrist_hash(self):
+        return self.position_hash ^ (ZOBRIST_DARK_TO_MOVE if self.current_player else 0)
+
+    def set_count(self, index, value):
+        counts = self.counts
+        self.position_hash ^= ZOBRIST_COUNTS[index][counts[index]] ^ ZOBRIST_COUNTS[index][value]
+        counts[index] = value
+
+    def top(self, col):
+        height = self.heights[col]
+        return self.cells[col * 5 + height - 1] if height else 0
+
+    def push(self, col, code):
+        index = col * 5 + self.heights[col]
+        # The cell was empty (key 0), so only the new piece's key changes
+        self.position_hash ^= ZOBRIST_CELLS[index][code]
+        self.cells[index] = code
+        self.heights[col] += 1
+
+    def place_roundel(self, col):
+        player = self.current_player
+        if self.counts[player * 4] < 1:
+            return 0  # Out of roundels
+        if self.heights[col] >= 5:
+            return 0  # Column is full
+        piece = 3 if player else 1
+        blocker = 2 if player else 4
+        if self.top(col) == blocker:
+            return 0  # Column is blocked
+        self.push(col, piece)
+        self.set_count(player * 4, self.counts[player * 4] - 1)
+        if self.heights[col] == 5:
+            self.score[player] += 1
+        return 1
+
+    def place_blocker(self, cols):
+        heights = self.heights
+        if any(heights[col] >= 5 for col in cols):
+            return 0  # Column is full
+
+        if len(cols) == 1:
+            kind = 1
+
+        elif len(cols) == 2:
+            kind = 2
+
+            if cols[0] == cols[1]:
+                return 0 #Invalid columns for d-blocker
+
+            if heights[cols[0]] != heights[cols[1]]:
+                return 0 #Invalid columns for d-blocker
+
+            if cols[0] not in NEIGHBORS[cols[1]]:
+                return 0 #Non adjacent columns
+
+        elif len(cols) == 3:
+            kind = 3
+            sizes = [heights[col] for col in cols]
+
+            # Check if the total column heights are within allowable limits
+            if sum(sizes) >= 11:
+                return 0  # Combined stack height exceeds allowed limit
+
+            # Validate if columns form 2-stacked with 1 adjacent configuration
+            if not (
+                (cols[0] == cols[1] and cols[0] in NEIGHBORS[cols[2]] and ((sizes[2] - sizes[0]) == 0 or (sizes[2] - sizes[0]) == 1)) or
+                (cols[1] == cols[2] and cols[1] in NEIGHBORS[cols[0]] and ((sizes[0] - sizes[1]) == 0 or (sizes[0] - sizes[1]) == 1)) or
+                (cols[2] == cols[0] and cols[2] in NEIGHBORS[cols[1]] and ((sizes[1] - sizes[2]) == 0 or (sizes[1] - sizes[2]) == 1))
+            ):
+                return 0  # Invalid column arrangement for triple-blockers
+
+        else:
+            return 0  # Invalid blocker type
+
+        index = self.current_player * 4 + kind
+        if self.counts[index] < 1:
+            return 0  # Out of blockers
+        piece = 4 if self.current_player else 2
+        for col in cols:
+            self.push(col, piece)
+        self.set_count(index, self.counts[index] - 1)
+        return 1
+
+    def clone(self):
+        state = ColumnsState.__new__(ColumnsState)
+        state.cells = bytearray(self.cells)
+        state.heights = bytearray(self.heights)
+        state.counts = bytearray(self.counts)
+        state.score = list(self.score)
+        state.current_player = self.current_player
+        state.position_hash = self.position_hash
+        return state
+
+    def pop(self, col):
+        self.heights[col] -= 1
+        index = col * 5 + self.heights[col]
+        self.position_hash ^= ZOBRIST_CELLS[index][self.cells[index]]
+        self.cells[index] = 0
+
+    def make(self, move):
+        """
+        Plays a parsed Move like place(), but returns an undo record for
+        undo(), or None if the move is rejected (leaving the state as it was).
+        """
+        player = self.current_player
+        score = tuple(self.score)
+        if not self.place(move):
+            return None
+        return (move, player, score)
+
+    def undo(self, record):
+        """
+        Takes back a move played with make(), including whose turn it was.
+        Moves must be undone in the reverse order they were made.
+        """
+        move, player, score = record
+        for col in reversed(move.cols):
+            self.pop(col)
+        index = player * 4 + move.kind
+        self.set_count(index, self.counts[index] + 1)
+        self.score[0], self.score[1] = score
+        self.current_player = player
+
+    def place(self, move):
+        """
+        Plays a parsed Move. Returns 1 if the move is accepted, otherwise 0.
+        """
+        if not move.valid:
+            return 0
+        heights = self.heights
+        cols = move.cols
+        for col in cols:
+            if heights[col] >= 5:
+                return 0
+
+        if move.kind == 0:
+            return self.place_roundel(cols[0])
+
+        index = self.current_player * 4 + move.kind
+        if self.counts[index] < 1:
+            return 0  # Out of blockers
+        if move.kind == 2 and heights[cols[0]] != heights[cols[1]]:
+            return 0
+        if move.kind == 3:
+            doubled, single = move.pair
+            step = heights[single] - heights[doubled]
+            if heights[cols[0]] + heights[cols[1]] + heights[cols[2]] >= 11 or step not in (0, 1):
+                return 0
+
+        piece = 4 if self.current_player else 2
+        for col in cols:
+            self.push(col, piece)
+        self.set_count(index, self.counts[index] - 1)
+        return 1
+
 class Column:
-    def __init__(self, column_num):
+    """
+    View of a single column of a ColumnsState, presenting it as a stack of
+    piece strings ("Lr", "Db", ...).
+    """
+    def __init__(self, column_num, state=None):
         self.num = column_num
         self.neighbors = restricted_neighbors(self.num)
+        self.state = state if state is not None else ColumnsState()
+
+    @property
+    def stack(self):
+        base = self.num * 5
+        return [PIECES[code] for code in self.state.cells[base:base + self.state.heights[self.num]]]
 
-        self.stack = [] * 5
-    
     def size(self):
-        return len(self.stack)
+        return self.state.heights[self.num]
 
     def is_empty(self):
-        return len(self.stack) == 0
+        return self.state.heights[self.num] == 0
     
     def push(self, piece):
-        self.stack.append(piece)
+        self.state.push(self.num, PIECE_CODES[piece])
     
     def peek(self):
-        if self.is_empty():
-            return ""
-        return self.stack[-1]
+        return PIECES[self.state.top(self.num)]
+
+class PieceCounter(Mapping):
+    """
+    Dict-like view of one player's unplaced pieces in a ColumnsState.
+    """
+    def __init__(self, state, player):
+        self.state = state
+        self.offset = player * 4
+
+    def __getitem__(self, piece_type):
+        return self.state.counts[self.offset + PIECE_TYPES.index(piece_type)]
+
+    def __setitem__(self, piece_type, value):
+        self.state.set_count(self.offset + PIECE_TYPES.index(piece_type), value)
+
+    def __iter__(self):
+        return iter(PIECE_TYPES)
+
+    def __len__(self):
+        return len(PIECE_TYPES)
+
+    def __repr__(self):
+        return repr(dict(self))
 
 class ColumnsGame:
-    def __init__(self):
-        self.board = [Column(i) for i in range(12)]
+    """
+    Game front-end over a ColumnsState. The board, pieces and score attributes
+    are views onto the compact state so display and logging code can keep
+    reading them as before.
+    """
+    def __init__(self, state=None, move_table=None):
+        self.state = state if state is not None else ColumnsState()
+        self._move_table = move_table
+        self.board = [Column(i, self.state) for i in range(12)]
         self.stack_height = 5
         self.players = ["Light", "Dark"]
-        self.score = [0, 0]
-        self.current_player = 0
         self.pieces = {
-            "Light": {"roundels": 12, "blockers": 3, "d-blockers": 3, "l-blockers": 3},
-            "Dark": {"roundels": 12, "blockers": 3, "d-blockers": 3, "l-blockers": 3}
+            "Light": PieceCounter(self.state, 0),
+            "Dark": PieceCounter(self.state, 1)
         }
+        self.attach_views()
+
+    def attach_views(self):
+        # NumPy views over the state's buffers, used to encode without copying
+        self.cell_codes = np.frombuffer(self.state.cells, dtype=np.uint8)
+        self.piece_counts = np.frombuffer(self.state.counts, dtype=np.uint8)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["cell_codes"], state["piece_counts"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.attach_views()
+
+    @property
+    def move_table(self):
+        if self._move_table is None:
+            self._move_table = get_move_table()
+        return self._move_table
+
+    @property
+    def current_player(self):
+        return self.state.current_player
+
+    @current_player.setter
+    def current_player(self, player):
+        self.state.current_player = player
+
+    @property
+    def zobrist_hash(self):
+        """
+        64-bit Zobrist hash of the board, unplaced pieces and side to move.
+        """
+        return self.state.zobrist_hash
+
+    @property
+    def position_hash(self):
+        """
+        Zobrist hash of the network inputs alone (board and unplaced pieces).
+        """
+        return self.state.position_hash
+
+    def compute_hash(self):
+        """
+        Recomputes zobrist_hash from scratch, for checking the incremental one.
+        """
+        return self.state.compute_hash()
+
+    @property
+    def score(self):
+        return self.state.score
+
+    @score.setter
+    def score(self, score):
+        self.state.score = score
 
     def calc_score(self):
         for c in self.board:
@@ -102,64 +582,35 @@ class ColumnsGame:
         except (ValueError, IndexError):
             return 0  # Invalid format or out-of-range values
 
-    def place_roundel(self, col):
-        if self.pieces[self.players[self.current_player]]["roundels"] < 1:
-            return 0  # Out of roundels
-        piece = "Dr" if self.current_player else "Lr"
-        blocker = "Lb" if self.current_player else "Db"
-        if self.board[col].peek() == blocker:
-            return 0  # Column is blocked
-        self.board[col].push(piece)
-        self.pieces[self.players[self.current_player]]["roundels"] -= 1
-        self.update_score(piece, col)
-        return 1
-
-    def place_blocker(self, cols):
-        if len(cols) == 1:
-            piece_type = "blockers"
-
-        elif len(cols) == 2:
-            piece_type = "d-blockers"
-
-            if cols[0] == cols[1]:
-                return 0 #Invalid columns for d-blocker
-
-            if self.board[cols[0]].size() != self.board[cols[1]].size():
-                return 0 #Invalid columns for d-blocker
-            
-            if cols[0] not in restricted_neighbors(cols[1]):
-                return 0 #Non adjacent columns
-            
-        elif len(cols) == 3:
-            piece_type = "l-blockers"
-            sizes = [self.board[col].size() for col in cols]
+    def apply_move(self, move_index):
+        """
+        Plays the move at the given index of the move table.
+        Returns 1 if the move is accepted, otherwise returns 0.
+        """
+        return self.state.place(self.move_table[move_index])
 
-            # Check if the total column heights are within allowable limits
-            if sum(sizes) >= 11:
-                return 0  # Combined stack height exceeds allowed limit
+    def make_move(self, move_index):
+        """
+        Plays the move at the given index of the move table and returns an
+        undo record for undo_move, or None if the move is rejected.
+        """
+        return self.state.make(self.move_table[move_index])
 
-            # Validate if columns form 2-stacked with 1 adjacent configuration
-            if not ( #FUTURE BJ: remove same column checker for actual implementation... should not be required with a C3 0, 1, 2 value as output representation
-                (cols[0] == cols[1] and cols[0] in restricted_neighbors(cols[2]) and ((sizes[2] - sizes[0]) == 0 or (sizes[2] - sizes[0]) == 1)) or
-                (cols[1] == cols[2] and cols[1] in restricted_neighbors(cols[0]) and ((sizes[0] - sizes[1]) == 0 or (sizes[0] - sizes[1]) == 1)) or
-                (cols[2] == cols[0] and cols[2] in restricted_neighbors(cols[1]) and ((sizes[1] - sizes[2]) == 0 or (sizes[1] - sizes[2]) == 1))
-            ):
-                return 0  # Invalid column arrangement for triple-blockers
-            
-        else:
-            return 0  # Invalid blocker type
+    def undo_move(self, record):
+        self.state.undo(record)
 
-        if self.pieces[self.players[self.current_player]][piece_type] < 1:
-            return 0  # Out of blockers
-        piece = "Db" if self.current_player else "Lb"
-        for col in cols:
-            self.board[col].push(piece)
-        self.pieces[self.players[self.current_player]][piece_type] -= 1
+    def clone(self):
+        """
+        Copies the game by copying its compact state, which is far cheaper
+        than deep-copying the board views.
+        """
+        return ColumnsGame(self.state.clone(), self._move_table)
 
-        # print(f"{self.pieces[self.players[self.current_player]]} {piece_type}")
-        # print(self.pieces[self.players[self.current_player]][piece_type])
+    def place_roundel(self, col):
+        return self.state.place_roundel(col)
 
-        return 1
+    def place_blocker(self, cols):
+        return self.state.place_blocker(cols)
 
     def display_board(self):
         print("\n______ ______ ______ ______ ~|~ ______ |COLUMN GAME| ______ ~|~ ______ ______ ______ ______")
@@ -209,8 +660,2341 @@ class ColumnsGame:
             if feedback == 1:
                 self.current_player ^= 1
 
-class AiEngine:
+# NumPy versions of neat-python's built-in activation functions, with the
+# same scaling and clamping so batched outputs match FeedForwardNetwork
+def _np_inv(z):
+    with np.errstate(divide="ignore"):
+        return np.where(z == 0.0, 0.0, 1.0 / np.where(z == 0.0, 1.0, z))
+
+NUMPY_ACTIVATIONS = {
+    "sigmoid": lambda z: 1.0 / (1.0 + np.exp(-np.clip(5.0 * z, -60.0, 60.0))),
+    "tanh": lambda z: np.tanh(np.clip(2.5 * z, -60.0, 60.0)),
+    "sin": lambda z: np.sin(np.clip(5.0 * z, -60.0, 60.0)),
+    "gauss": lambda z: np.exp(-5.0 * np.clip(z, -3.4, 3.4) ** 2),
+    "relu": lambda z: np.where(z > 0.0, z, 0.0),
+    "elu": lambda z: np.where(z > 0.0, z, np.expm1(np.minimum(z, 0.0))),
+    "lelu": lambda z: np.where(z > 0.0, z, 0.005 * z),
+    "selu": lambda z: 1.0507009873554804934193349852946 * np.where(
+        z > 0.0, z, 1.6732632423543772848170429916717 * np.expm1(np.minimum(z, 0.0))),
+    "softplus": lambda z: 0.2 * np.log1p(np.exp(np.clip(5.0 * z, -60.0, 60.0))),
+    "identity": lambda z: z,
+    "clamped": lambda z: np.clip(z, -1.0, 1.0),
+    "inv": _np_inv,
+    "log": lambda z: np.log(np.maximum(z, 1e-7)),
+    "exp": lambda z: np.exp(np.clip(z, -60.0, 60.0)),
+    "abs": np.abs,
+    "hat": lambda z: np.maximum(0.0, 1 - np.abs(z)),
+    "square": lambda z: z ** 2,
+    "cube": lambda z: z ** 3,
+}
+
+class CompiledNetwork:
+    """
+    Layered NumPy form of a feed-forward NEAT network that evaluates a whole
+    batch of encoded states in one call.
+
+    Node values live in a (batch, values) array holding the inputs, the
+    outputs and then every hidden node. Each layer is one dense weight matrix
+    from the value columns it reads, plus per-node bias and response, with
+    its nodes grouped by activation function.
+    """
+    def __init__(self, input_keys, output_keys, node_evals, activation_defs=None):
+        """
+        Args:
+            input_keys, output_keys: Node keys as in the NEAT genome config.
+            node_evals: (node, activation, aggregation, bias, response, links)
+                tuples in evaluation order, where activation and aggregation are
+                function names and links is a list of (input node, weight).
+            activation_defs: Optional neat ActivationFunctionSet used for
+                activation functions without a NumPy version.
+        """
+        self.input_keys = list(input_keys)
+        self.output_keys = list(output_keys)
+        self.node_evals = list(node_evals)
+
+        column = {key: i for i, key in enumerate(self.input_keys)}
+        for key in self.output_keys:
+            column.setdefault(key, len(column))
+
+        # Group nodes into layers by their longest path from the inputs
+        depth = {}
+        layers = {}
+        for node, activation, aggregation, bias, response, links in self.node_evals:
+            if aggregation not in ["sum", "mean"]:
+                raise ValueError(f"Aggregation '{aggregation}' is not supported by CompiledNetwork.")
+            for i, _ in links:
+                column.setdefault(i, len(column))
+            column.setdefault(node, len(column))
+            depth[node] = 1 + max((depth.get(i, 0) for i, _ in links), default=0)
+            layers.setdefault(depth[node], []).append((node, activation, aggregation, bias, response, links))
+
+        self.layers = []
+        self.layer_activations = []  # Activation name of each group, by layer
+        for level in sorted(layers):
+            nodes = layers[level]
+            sources = sorted({column[i] for *_, links in nodes for i, _ in links})
+            source_row = {col: row for row, col in enumerate(sources)}
+            weights = np.zeros((len(sources), len(nodes)))
+            for n, (node, activation, aggregation, bias, response, links) in enumerate(nodes):
+                for i, w in links:
+                    weights[source_row[column[i]], n] += w
+                if aggregation == "mean" and links:
+                    weights[:, n] /= len(links)
+
+            groups = {}
+            for n, (node, activation, *_) in enumerate(nodes):
+                groups.setdefault(activation, []).append(n)
+
+            self.layers.append((
+                np.array(sources, dtype=np.int64),
+                weights,
+                np.array([node_eval[3] for node_eval in nodes]),
+                np.array([node_eval[4] for node_eval in nodes]),
+                np.array([column[node_eval[0]] for node_eval in nodes], dtype=np.int64),
+                [(self.activation_function(name, activation_defs), np.array(positions, dtype=np.int64))
+                 for name, positions in groups.items()],
+            ))
+            self.layer_activations.append(list(groups))
+
+        self.num_values = len(column)
+        self.output_columns = np.array([column[key] for key in self.output_keys], dtype=np.int64)
+
+    @staticmethod
+    def activation_function(name, activation_defs=None):
+        if name in NUMPY_ACTIVATIONS:
+            return NUMPY_ACTIVATIONS[name]
+        if activation_defs is None:
+            raise ValueError(f"No NumPy version of activation function '{name}'.")
+        return np.vectorize(activation_defs.get(name), otypes=[np.float64])
+
+    @staticmethod
+    def genome_node_evals(genome, config):
+        """
+        The node_evals of a genome's network: exactly the nodes and links
+        neat.nn.FeedForwardNetwork.create would evaluate, in its order.
+        """
+        net = neat.nn.FeedForwardNetwork.create(genome, config)
+        return [
+            (node, genome.nodes[node].activation, genome.nodes[node].aggregation, bias, response, links)
+            for node, _, _, bias, response, links in net.node_evals
+        ]
+
+    @staticmethod
+    def create(genome, config):
+        """
+        Compiles a genome, using exactly the nodes and links that
+        neat.nn.FeedForwardNetwork.create would evaluate.
+        """
+        return CompiledNetwork(
+            config.genome_config.input_keys,
+            config.genome_config.output_keys,
+            CompiledNetwork.genome_node_evals(genome, config),
+            config.genome_config.activation_defs,
+        )
+
+    @staticmethod
+    def from_bytes(data, activation_defs=None):
+        """
+        Compiles a network packed with encode_network, without building any
+        neat-python objects.
+        """
+        return decode_network(data).compile(activation_defs)
+
+    def share(self, prefix, arrays):
+        """
+        Adds the arrays activate_batch reads to arrays under names starting
+        with prefix, and returns the small structure from_shared needs to
+        rebuild this network around them.
+        """
+        layers = []
+        for l, ((sources, weights, bias, response, targets, groups), names) in enumerate(zip(self.layers, self.layer_activations)):
+            layer = []
+            for part, array in (("sources", sources), ("weights", weights), ("bias", bias), ("response", response), ("targets", targets)):
+                arrays[f"{prefix}/{l}/{part}"] = array
+                layer.append(f"{prefix}/{l}/{part}")
+            for g, (name, (_, positions)) in enumerate(zip(names, groups)):
+                arrays[f"{prefix}/{l}/group{g}"] = positions
+                layer.append((name, f"{prefix}/{l}/group{g}"))
+            layers.append(layer)
+        arrays[f"{prefix}/outputs"] = self.output_columns
+        return (self.input_keys, self.output_keys, self.num_values, f"{prefix}/outputs", layers)
+
+    @classmethod
+    def from_shared(cls, structure, arrays, activation_defs=None):
+        """
+        Rebuilds a network shared with share() whose arrays are now in
+        arrays (e.g. views onto a shared memory segment), without copying
+        them.
+        """
+        input_keys, output_keys, num_values, outputs, layers = structure
+        net = cls.__new__(cls)
+        net.input_keys = input_keys
+        net.output_keys = output_keys
+        net.node_evals = None
+        net.num_values = num_values
+        net.output_columns = arrays[outputs]
+        net.layers = []
+        net.layer_activations = []
+        for sources, weights, bias, response, targets, *groups in layers:
+            net.layers.append((
+                arrays[sources], arrays[weights], arrays[bias], arrays[response], arrays[targets],
+                [(cls.activation_function(name, activation_defs), arrays[positions]) for name, positions in groups],
+            ))
+            net.layer_activations.append([name for name, _ in groups])
+        return net
+
+    def activate_batch(self, states):
+        """
+        Evaluates a (batch, inputs) array of states, returning (batch, outputs).
+        """
+        states = np.asarray(states, dtype=np.float64)
+        values = np.zeros((states.shape[0], self.num_values))
+        values[:, :len(self.input_keys)] = states
+
+        for sources, weights, bias, response, targets, groups in self.layers:
+            z = bias + response * (values[:, sources] @ weights)
+            for function, positions in groups:
+                values[:, targets[positions]] = function(z[:, positions])
+
+        return values[:, self.output_columns]
+
+    def activate(self, inputs):
+        """
+        Drop-in replacement for FeedForwardNetwork.activate on a single state.
+        """
+        if len(self.input_keys) != len(inputs):
+            raise RuntimeError(f"Expected {len(self.input_keys):n} inputs, got {len(inputs):n}")
+        return self.activate_batch(np.asarray(inputs, dtype=np.float64)[None, :])[0].tolist()
+
+# Packed networks. A header, then the input and output keys (<i4), one
+# NETWORK_NODE record per evaluated node in evaluation order, the links of
+# every node in that order as NETWORK_LINK records, and the activation and
+# aggregation function names as newline-separated UTF-8 that the nodes'
+# activation and aggregation ids index into. Bias, response and weights stay
+# float64 so decoded networks give exactly the same outputs.
+NETWORK_MAGIC = b"CNW1"
+NETWORK_VERSION = 1
+NETWORK_HEADER = struct.Struct("<4sHqIIIII")
+NETWORK_NODE = np.dtype([
+    ("key", "<i4"), ("activation", "u1"), ("aggregation", "u1"), ("links", "<u4"), ("bias", "<f8"), ("response", "<f8"),
+])
+NETWORK_LINK = np.dtype([("source", "<i4"), ("weight", "<f8")])
+
+def encode_network(genome, config):
+    """
+    Packs the network a genome evaluates to into a few bytes per node and
+    link, far smaller and quicker to ship than the pickled genome.
+    """
+    node_evals = CompiledNetwork.genome_node_evals(genome, config)
+    names = sorted({name for _, activation, aggregation, *_ in node_evals for name in (activation, aggregation)})
+    name_ids = {name: i for i, name in enumerate(names)}
+
+    nodes = np.empty(len(node_evals), dtype=NETWORK_NODE)
+    links = np.empty(sum(len(node_eval[5]) for node_eval in node_evals), dtype=NETWORK_LINK)
+    start = 0
+    for n, (node, activation, aggregation, bias, response, node_links) in enumerate(node_evals):
+        nodes[n] = (node, name_ids[activation], name_ids[aggregation], len(node_links), bias, response)
+        links[start:start + len(node_links)] = node_links
+        start += len(node_links)
+
+    input_keys = np.asarray(config.genome_config.input_keys, dtype="<i4")
+    output_keys = np.asarray(config.genome_config.output_keys, dtype="<i4")
+    name_bytes = "\n".join(names).encode()
+    header = NETWORK_HEADER.pack(
+        NETWORK_MAGIC, NETWORK_VERSION, genome.key, len(input_keys), len(output_keys), len(nodes), len(links), len(name_bytes),
+    )
+    return b"".join((header, input_keys.tobytes(), output_keys.tobytes(), nodes.tobytes(), links.tobytes(), name_bytes))
+
+def decode_network(data):
+    """
+    Unpacks bytes from encode_network into a PackedNetwork.
+    """
+    magic, version, key, num_inputs, num_outputs, num_nodes, num_links, names_size = NETWORK_HEADER.unpack_from(data)
+    if magic != NETWORK_MAGIC or version != NETWORK_VERSION:
+        raise ValueError("Not a version 1 packed network.")
+
+    offset = NETWORK_HEADER.size
+    arrays = []
+    for dtype, count in (("<i4", num_inputs), ("<i4", num_outputs), (NETWORK_NODE, num_nodes), (NETWORK_LINK, num_links)):
+        arrays.append(np.frombuffer(data, dtype=dtype, count=count, offset=offset))
+        offset += arrays[-1].nbytes
+    input_keys, output_keys, nodes, links = arrays
+    names = bytes(data[offset:offset + names_size]).decode().split("\n")
+
+    sources = links["source"].tolist()
+    weights = links["weight"].tolist()
+    node_evals = []
+    start = 0
+    for node, activation, aggregation, count, bias, response in nodes.tolist():
+        node_evals.append((
+            node, names[activation], names[aggregation], bias, response,
+            list(zip(sources[start:start + count], weights[start:start + count])),
+        ))
+        start += count
+    return PackedNetwork(key, input_keys.tolist(), output_keys.tolist(), node_evals, hashlib.sha1(data).hexdigest())
+
+class PackedNetwork:
+    """
+    A network decoded from encode_network's bytes. It stands in for the
+    genome in a worker's play_game, which only reads the key and adds to
+    fitness, and builds the networks to play it with.
+    """
+    def __init__(self, key, input_keys, output_keys, node_evals, content_hash=None):
+        self.key = key
+        self.fitness = 0
+        self.content_hash = content_hash  # Of the packed bytes, for NetworkCache
+        self.input_keys = input_keys
+        self.output_keys = output_keys
+        self.node_evals = node_evals
+
+    def compile(self, activation_defs=None):
+        return CompiledNetwork(self.input_keys, self.output_keys, self.node_evals, activation_defs)
+
+    def feed_forward(self, genome_config):
+        """
+        The neat.nn.FeedForwardNetwork FeedForwardNetwork.create builds for
+        the genome, made from the packed arrays.
+        """
+        return neat.nn.FeedForwardNetwork(self.input_keys, self.output_keys, [
+            (node, genome_config.activation_defs.get(activation), genome_config.aggregation_function_defs.get(aggregation),
+             bias, response, links)
+            for node, activation, aggregation, bias, response, links in self.node_evals
+        ])
+
+class ActivationCache:
+    """
+    Bounded LRU cache in front of one genome's network. Feed-forward networks
+    are deterministic, so a position seen before (the openings repeat in
+    nearly every game) can reuse the stored outputs instead of activating
+    the network again. Entries are keyed on the position's Zobrist hash when
+    the caller passes one, otherwise on the 68 encoded inputs packed into
+    bytes; the least recently used entry is dropped once max_size is
+    reached.
+    """
+    def __init__(self, net, max_size):
+        self.net = net
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(inputs):
+        # Every input is a piece code or a piece count, so one byte each
+        return np.asarray(inputs, dtype=np.uint8).tobytes()
+
+    def activate(self, inputs, key=None):
+        if key is None:
+            key = self.key(inputs)
+        output = self.entries.get(key)
+        if output is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return output
+
+        self.misses += 1
+        output = np.array(self.net.activate(inputs))
+        self.entries[key] = output
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return output
+
+class LockstepSelfPlay:
+    """
+    Plays a set of games side by side, advancing every live game one ply per
+    step. Boards are held as arrays across games (cells, heights, counters,
+    scores and side to move), all live boards are encoded into one (N, 68)
+    array and each genome's CompiledNetwork evaluates its share in one batch.
+
+    Scoring and end conditions follow AiEngine.play_game: +0.10 for a valid
+    pick, -0.10 and an invalid move for an illegal one, -0.001 for every move
+    the retry loop would reject, and the game ends on a double pass, when the
+    mover runs out of pieces or after 100 turns.
+    """
+    max_turns = 100
+
+    def __init__(self, engine, nets, pairings=None, arrays=None):
+        """
+        Args:
+            engine: The AiEngine whose move table and move_selection are used.
+            nets: Maps genome id to CompiledNetwork.
+            pairings: (light genome id, dark genome id) for each game.
+            arrays: Per-game state to play in instead of new arrays, such as
+                views onto a shared memory segment (see array_specs and
+                start_arrays). Its sides already index into list(nets), so
+                pairings is not needed.
+        """
+        self.table = engine.move_table
+        self.profiler = engine.profiler
+        self.retry_rank = engine.retry_rank
+        self.masked = engine.settings.move_selection == "masked"
+        self.nets = nets
+        self.genome_ids = list(nets)
+
+        if arrays is None:
+            pairings = list(pairings)
+            arrays = {name: np.empty(shape, dtype) for name, (shape, dtype) in self.array_specs(len(pairings)).items()}
+            index = {genome_id: i for i, genome_id in enumerate(self.genome_ids)}
+            self.start_arrays(arrays, [[index[light], index[dark]] for light, dark in pairings])
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        self.num_games = len(self.sides)
+        self.inputs = np.empty((self.num_games, 68))
+
+    @classmethod
+    def array_specs(cls, num_games):
+        """
+        {name: (shape, dtype)} of the per-game state arrays.
+        """
+        return {
+            # Index into the genome ids of the Light and Dark players
+            "sides": ((num_games, 2), np.int64),
+            "cells": ((num_games, 60), np.int8),
+            "heights": ((num_games, 12), np.int8),
+            "counts": ((num_games, 8), np.int8),
+            "score": ((num_games, 2), np.int64),
+            "player": ((num_games,), np.int64),
+            "turn": ((num_games,), np.int64),
+            "last_pass": ((num_games,), bool),
+            "live": ((num_games,), bool),
+            "fits": ((num_games, 2), np.float64),
+            "invalid_moves": ((num_games, 2), np.int64),
+            # Per-ply record: move index (-1 for a pass), invalid flag and alt moves
+            "plies": ((num_games,), np.int64),
+            "history": ((num_games, cls.max_turns), np.int64),
+            "history_invalid": ((num_games, cls.max_turns), np.int8),
+            "history_alts": ((num_games, cls.max_turns), np.int64),
+        }
+
+    @staticmethod
+    def start_arrays(arrays, sides):
+        """
+        Sets arrays shaped by array_specs to the opening position of every
+        game, with sides giving each game's (light, dark) genome index.
+        """
+        for array in arrays.values():
+            array[...] = 0
+        arrays["sides"][...] = np.asarray(sides, dtype=np.int64).reshape(-1, 2)
+        arrays["counts"][...] = [12, 3, 3, 3, 12, 3, 3, 3]
+        arrays["live"][...] = True
+        arrays["history"][...] = -1
+
+    def encode(self, rows):
+        """
+        Encodes the given games into the front rows of the preallocated
+        input matrix, matching encode_state.
+        """
+        inputs = self.inputs[:len(rows)]
+        inputs[:, :60] = self.cells[rows]
+        inputs[:, 60:] = self.counts[rows]
+        return inputs
+
+    def activate(self, rows, inputs):
+        """
+        Evaluates the inputs with each mover's network, one batch per genome.
+        """
+        movers = self.sides[rows, self.player[rows]]
+        outputs = np.empty((len(rows), len(self.table)))
+        order = np.argsort(movers, kind="stable")
+        starts = np.flatnonzero(np.diff(movers[order], prepend=-1))
+        for group in np.split(order, starts[1:]):
+            net = self.nets[self.genome_ids[movers[group[0]]]]
+            outputs[group] = net.activate_batch(inputs[group])
+        return outputs
+
+    def step(self):
+        """
+        Advances every live game by one ply.
+        """
+        profiling = self.profiler.enabled
+        if profiling:
+            started = time.perf_counter()
+
+        rows = np.flatnonzero(self.live)
+        player = self.player[rows]
+        inputs = self.encode(rows)
+        if profiling:
+            started = self.profiler.lap("encode_state", started)
+        outputs = self.activate(rows, inputs)
+        if profiling:
+            started = self.profiler.lap("activate", started)
+
+        # Same pick as decode_move_index: argmax of the softmax
+        exp_outputs = np.exp(outputs - outputs.max(axis=1, keepdims=True))
+        picks = np.argmax(exp_outputs / exp_outputs.sum(axis=1, keepdims=True), axis=1)
+        if profiling:
+            started = self.profiler.lap("decode_output", started)
+
+        heights = self.heights[rows]
+        tops = self.cells[rows].reshape(-1, 12, 5)[np.arange(len(rows))[:, None], np.arange(12), heights - 1]
+        mask = self.table.legal_mask(heights, tops, self.counts[rows], player)
+        valid = mask[np.arange(len(rows)), picks]
+
+        self.fits[rows[valid], player[valid]] += 0.10
+        self.fits[rows[~valid], player[~valid]] -= 0.10
+        self.invalid_moves[rows[~valid], player[~valid]] += 1
+
+        # Replacement moves for illegal picks, as in select_legal_move
+        any_legal = mask.any(axis=1)
+        if self.masked:
+            alts = np.argmax(np.where(mask, outputs, -np.inf), axis=1)
+        else:
+            alts = np.argmin(np.where(mask, self.retry_rank[picks], mask.shape[1]), axis=1)
+        alt_moves = np.where(any_legal, self.retry_rank[picks, alts] + 1, mask.shape[1])
+        alt_moves[valid] = 0
+        chosen = np.where(valid, picks, np.where(any_legal, alts, -1))
+
+        # One -0.001 per move the retry loop would reject, applied one at a time
+        rejected = alt_moves - (chosen >= 0) * (~valid)
+        for r in range(int(rejected.max(initial=0))):
+            penalised = rejected > r
+            self.fits[rows[penalised], player[penalised]] -= 0.001
+        if profiling:
+            started = self.profiler.lap("next_nearest_move", started)
+
+        self.apply(rows, player, chosen)
+        if profiling:
+            self.profiler.lap("process_move", started)
+            self.profiler.count("plies", len(rows))
+            self.profiler.count("picks", len(rows))
+            self.profiler.count("invalid_moves", int((~valid).sum()))
+
+        ply = self.plies[rows]
+        self.history[rows, ply] = chosen
+        self.history_invalid[rows, ply] = ~valid
+        self.history_alts[rows, ply] = alt_moves
+        self.plies[rows] += 1
+
+        # End conditions, in the order play_game checks them
+        passed = chosen < 0
+        finished = passed & self.last_pass[rows]
+        self.last_pass[rows] = passed
+        pieces = self.counts[rows].reshape(-1, 2, 4)[np.arange(len(rows)), player]
+        finished |= (pieces == 0).all(axis=1)
+        self.player[rows] ^= 1
+        self.turn[rows] += 1
+        finished |= self.turn[rows] >= self.max_turns
+        self.live[rows[finished]] = False
+
+    def apply(self, rows, player, chosen):
+        """
+        Plays the chosen (already legal) moves; -1 is a pass.
+        """
+        moving = chosen >= 0
+        rows, player, chosen = rows[moving], player[moving], chosen[moving]
+        kind = self.table.kind[chosen]
+        cols = self.table.cols[chosen]
+        num_cols = self.table.num_cols[chosen]
+
+        piece = np.where(kind == 0, np.where(player == 1, 3, 1), np.where(player == 1, 4, 2)).astype(np.int8)
+        for k in range(3):
+            placing = num_cols > k
+            g, col = rows[placing], cols[placing, k]
+            self.cells[g, col * 5 + self.heights[g, col]] = piece[placing]
+            self.heights[g, col] += 1
+
+        self.counts[rows, player * 4 + kind] -= 1
+
+        roundel = kind == 0
+        scored = roundel & (self.heights[rows, cols[:, 0]] == 5)
+        self.score[rows[scored], player[scored]] += 1
+
+    def run(self):
+        """
+        Plays every game to the end.
+
+        Returns:
+            list: One result dict per pairing, shaped like play_game's log_data.
+        """
+        self.play()
+        return self.results()
+
+    def play(self):
+        while self.live.any():
+            self.step()
+        if self.profiler.enabled:
+            self.profiler.count("games", self.num_games)
+
+    def results(self):
+        """
+        The result dicts of finished games (see run).
+        """
+        results = []
+        for g in range(self.num_games):
+            fits = [float(self.fits[g, 0]), float(self.fits[g, 1])]
+            light_score, dark_score = self.score[g]
+            if light_score > dark_score:
+                outcome = "Light Won"
+                fits[0] += 1
+            elif light_score < dark_score:
+                outcome = "Dark Won"
+                fits[1] += 1
+            else:
+                outcome = "Draw"
+                fits[0] += 0.5
+                fits[1] += 0.5
+
+            results.append({
+                "result": outcome,
+                "fitness_1": fits[0],
+                "fitness_2": fits[1],
+                "invalid_moves_1": int(self.invalid_moves[g, 0]),
+                "invalid_moves_2": int(self.invalid_moves[g, 1]),
+            })
+        return results
+
+    def game_log(self, g):
+        """
+        Rebuilds the log_data play_game would have produced for game g.
+        """
+        moves = []
+        for ply in range(self.plies[g]):
+            move_index = self.history[g, ply]
+            moves.append({
+                "move": self.table[move_index].text if move_index >= 0 else "Pass",
+                "invalid": int(self.history_invalid[g, ply]),
+                "alt_moves": int(self.history_alts[g, ply]),
+            })
+        state = ColumnsState.from_arrays(self.cells[g], self.heights[g], self.counts[g], self.score[g], self.player[g])
+        return {"moves": moves, "game": ColumnsGame(state, self.table)}
+
+class SharedArrays:
+    """
+    Named NumPy arrays laid out in one multiprocessing.shared_memory
+    segment. The creating process passes {name: (shape, dtype)}; others
+    attach with the segment name and the small layout list, and get views
+    onto the same memory, so nothing is copied between processes.
+    """
+    alignment = 64
+
+    def __init__(self, segment, layout, owner=False):
+        self.segment = segment
+        self.layout = layout
+        self.owner = owner
+        self.arrays = {
+            key: np.ndarray(shape, dtype, buffer=segment.buf, offset=offset) for key, offset, shape, dtype in layout
+        }
+
+    @classmethod
+    def create(cls, specs):
+        layout = []
+        size = 0
+        for key, (shape, dtype) in specs.items():
+            dtype = np.dtype(dtype)
+            size = -(-size // cls.alignment) * cls.alignment
+            layout.append((key, size, tuple(shape), dtype.str))
+            size += int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+        return cls(shared_memory.SharedMemory(create=True, size=max(size, 1)), layout, owner=True)
+
+    @classmethod
+    def attach(cls, name, layout):
+        return cls(shared_memory.SharedMemory(name=name), layout)
+
+    @property
+    def name(self):
+        return self.segment.name
+
+    def close(self):
+        """
+        Releases this process's mapping, and removes the segment if this
+        process created it. Views of the arrays must be dropped first.
+        """
+        self.arrays = {}
+        self.segment.close()
+        if self.owner:
+            self.segment.unlink()
+
+class SharedSelfPlayPool:
+    """
+    Worker processes that play lockstep batches in shared memory. The
+    networks' weight matrices and every game's state arrays live in
+    SharedArrays segments; the queues only carry segment names, layouts,
+    game ranges and profiler totals, never states or outputs.
+    """
+    def __init__(self, engine, workers):
+        # Workers must share this process's resource tracker, or each would
+        # try to remove the segments it attached to when it exits
+        resource_tracker.ensure_running()
+        self.tasks = [multiprocessing.Queue() for _ in range(workers)]
+        self.replies = multiprocessing.Queue()
+        self.processes = [
+            multiprocessing.Process(target=_lockstep_worker, args=(engine, tasks, self.replies), daemon=True)
+            for tasks in self.tasks
+        ]
+        for process in self.processes:
+            process.start()
+        self.networks = None
+        self.closed = False
+        atexit.register(self.close)  # When evaluating outside train()
+
+    def share_networks(self, nets):
+        """
+        Copies nets (a list of CompiledNetworks, indexed like the games'
+        sides) into a new segment and hands it to every worker.
+        """
+        arrays = {}
+        structures = [net.share(str(n), arrays) for n, net in enumerate(nets)]
+        shared = SharedArrays.create({name: (array.shape, array.dtype) for name, array in arrays.items()})
+        for name, array in arrays.items():
+            shared.arrays[name][...] = array
+        for tasks in self.tasks:
+            tasks.put(("networks", (shared.name, shared.layout, structures)))
+
+        # Workers keep their own mapping of the old segment until they switch
+        if self.networks is not None:
+            self.networks.close()
+        self.networks = shared
+
+    def play(self, games, legs=1):
+        """
+        Plays the games in a SharedArrays segment (see
+        LockstepSelfPlay.array_specs), one contiguous share per worker.
+        Shares are whole multiples of legs, so both legs of a paired match
+        go to the same worker.
+
+        Returns:
+            list: each worker's Profiler totals.
+        """
+        num_games = len(games.arrays["sides"])
+        bounds = legs * (np.arange(len(self.tasks) + 1) * (num_games // legs) // len(self.tasks))
+        bounds[-1] = num_games
+        sent = 0
+        for tasks, lo, hi in zip(self.tasks, bounds[:-1], bounds[1:]):
+            if hi > lo:
+                tasks.put(("play", (games.name, games.layout, int(lo), int(hi))))
+                sent += 1
+
+        profiles = []
+        while len(profiles) < sent:
+            try:
+                kind, reply = self.replies.get(timeout=5)
+            except queue.Empty:
+                if not all(process.is_alive() for process in self.processes):
+                    raise RuntimeError("A shared-memory self-play worker exited.")
+                continue
+            if kind == "error":
+                raise RuntimeError(f"Shared-memory self-play worker failed:\n{reply}")
+            profiles.append(reply)
+        return profiles
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for tasks in self.tasks:
+            tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=10)
+        if self.networks is not None:
+            self.networks.close()
+            self.networks = None
+
+class SearchTimeout(Exception):
+    """
+    Raised inside a search when its time budget runs out.
+    """
+
+class SearchNode:
+    """
+    MCTS tree node. value_sum is from the point of view of the player who
+    made the move leading to this node.
+    """
+    __slots__ = ("prior", "visits", "value_sum", "children")
+
+    def __init__(self, prior):
+        self.prior = prior
+        self.visits = 0
+        self.value_sum = 0.0
+        self.children = None
+
+class SearchPlayer:
+    """
+    Chooses moves by searching ahead with make/undo on a private copy of the
+    ColumnsState, using a genome's network as its guide. End conditions
+    match AiEngine.play_game: a double pass, the mover running out of pieces
+    or max_turns turns.
+
+    method is "alphabeta" (negamax with iterative deepening and a Zobrist
+    transposition table; the network orders the moves and leaves are scored
+    on score difference) or "mcts" (PUCT with the network's softmax over
+    the legal moves as priors). Each choose() call searches until
+    time_budget seconds have passed and records nodes and elapsed time.
+    Positions covered by an optional Tablebase are scored exactly.
+    """
+    PASS = -1
+    WIN = 1000.0
+    max_turns = 100
+
+    def __init__(self, engine, net, method="alphabeta", time_budget=1.0, exploration=1.5, max_depth=64, tablebase=None):
+        if method not in ["alphabeta", "mcts"]:
+            raise ValueError(f"Unknown search method '{method}'.")
+        self.engine = engine
+        self.net = net
+        self.method = method
+        self.time_budget = time_budget
+        self.exploration = exploration
+        self.max_depth = max_depth
+        self.tablebase = tablebase
+        self.table = engine.move_table
+        self.inputs = np.empty(68)
+        self.nodes = 0
+        self.elapsed = 0.0
+        self.depth = 0
+
+    @property
+    def nodes_per_second(self):
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+    def choose(self, game, turn=0):
+        """
+        Returns the move index to play for the side to move in game, or None
+        if it has to pass. game itself is left untouched.
+        """
+        self.game = ColumnsGame(game.state.clone(), self.table)
+        self.state = self.game.state
+        self.nodes = 0
+        self.depth = 0
+        start = time.perf_counter()
+        self.deadline = start + self.time_budget
+
+        legal = self.legal()
+        solved = self.tablebase.lookup(self.state) if self.tablebase is not None else None
+        if len(legal) == 0:
+            move = None
+        elif solved is not None:
+            move = solved[1]
+        elif len(legal) == 1:
+            move = int(legal[0])
+        elif self.method == "mcts":
+            move = self.mcts(turn)
+        else:
+            move = self.iterative_deepening(legal, turn)
+
+        self.elapsed = time.perf_counter() - start
+        return move
+
+    def tick(self):
+        self.nodes += 1
+        if self.nodes & 63 == 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+
+    def legal(self):
+        return np.flatnonzero(legal_moves(self.game, self.table))
+
+    def activate(self):
+        self.engine.encode_state_into(self.game, self.inputs)
+        if isinstance(self.net, ActivationCache):
+            return np.asarray(self.net.activate(self.inputs, self.game.position_hash))
+        return np.asarray(self.net.activate(self.inputs))
+
+    def evaluate(self):
+        """
+        Static score of the position for the side to move.
+        """
+        player = self.state.current_player
+        return float(self.state.score[player] - self.state.score[player ^ 1])
+
+    def final_value(self, margin=None):
+        """
+        Value of a finished game for the side to move, given the final score
+        margin (by default the current one).
+        """
+        if margin is None:
+            margin = self.evaluate()
+        return (self.WIN if margin > 0 else -self.WIN if margin < 0 else 0.0) + margin
+
+    def solved_value(self, passes):
+        """
+        The exact value of the position from the tablebase, or None.
+        """
+        if self.tablebase is None:
+            return None
+        solved = self.tablebase.lookup(self.state, passes)
+        return None if solved is None else self.final_value(solved[0])
+
+    def play(self, move, passes, turn):
+        """
+        Makes move (or a pass) for the side to move and hands over the turn.
+
+        Returns:
+            (record, passes, ended): the undo record (None for a pass), the
+            new count of consecutive passes and whether the game is over.
+        """
+        state = self.state
+        player = state.current_player
+        if move == self.PASS:
+            record = None
+            passes += 1
+        else:
+            record = state.make(self.table[move])
+            passes = 0
+        ended = passes >= 2 or not any(state.counts[player * 4:player * 4 + 4]) or turn + 1 >= self.max_turns
+        state.current_player = player ^ 1
+        return record, passes, ended
+
+    def take_back(self, record):
+        if record is None:
+            self.state.current_player ^= 1
+        else:
+            self.state.undo(record)
+
+    def ordered_moves(self, legal):
+        """
+        Legal moves best-first by network output, or [PASS] if there are none.
+        """
+        if len(legal) == 0:
+            return [self.PASS]
+        output = self.activate()
+        return [int(move) for move in legal[np.argsort(-output[legal], kind="stable")]]
+
+    def iterative_deepening(self, legal, turn):
+        self.transpositions = {}
+        best = self.ordered_moves(legal)[0]
+        try:
+            for depth in range(1, self.max_depth + 1):
+                best = self.search_root(depth, turn, best)
+                self.depth = depth
+        except SearchTimeout:
+            pass  # Keep the best move of the deepest finished iteration
+        return best
+
+    def search_root(self, depth, turn, previous_best):
+        moves = self.ordered_moves(self.legal())
+        moves.remove(previous_best)
+        moves.insert(0, previous_best)
+
+        alpha, beta = -np.inf, np.inf
+        best = moves[0]
+        for move in moves:
+            record, passes, ended = self.play(move, 0, turn)
+            if ended:
+                value = -self.final_value()
+            else:
+                value = -self.negamax(depth - 1, -beta, -alpha, passes, turn + 1)
+            self.take_back(record)
+            if value > alpha:
+                alpha, best = value, move
+        return best
+
+    def negamax(self, depth, alpha, beta, passes, turn):
+        self.tick()
+        solved = self.solved_value(passes)
+        if solved is not None:
+            return solved
+        if depth == 0:
+            return self.evaluate()
+
+        key = (self.state.zobrist_hash, passes)
+        entry = self.transpositions.get(key)
+        tt_move = None
+        if entry is not None:
+            entry_depth, value, bound, tt_move = entry
+            if entry_depth >= depth and (
+                bound == 0 or (bound < 0 and value <= alpha) or (bound > 0 and value >= beta)
+            ):
+                return value
+
+        moves = self.ordered_moves(self.legal())
+        if tt_move is not None and tt_move in moves:
+            moves.remove(tt_move)
+            moves.insert(0, tt_move)
+
+        original_alpha = alpha
+        best_value, best_move = -np.inf, moves[0]
+        for move in moves:
+            record, new_passes, ended = self.play(move, passes, turn)
+            if ended:
+                value = -self.final_value()
+            else:
+                value = -self.negamax(depth - 1, -beta, -alpha, new_passes, turn + 1)
+            self.take_back(record)
+
+            if value > best_value:
+                best_value, best_move = value, move
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        # bound: -1 upper bound (failed low), 1 lower bound (cut off), 0 exact
+        bound = -1 if best_value <= original_alpha else 1 if best_value >= beta else 0
+        self.transpositions[key] = (depth, best_value, bound, best_move)
+        return best_value
+
+    def expand(self, node):
+        """
+        Adds node's children with network priors and returns the value of
+        its position for the side to move.
+        """
+        legal = self.legal()
+        if len(legal) == 0:
+            node.children = {self.PASS: SearchNode(1.0)}
+        else:
+            priors = softmax(self.activate()[legal])
+            node.children = {int(move): SearchNode(prior) for move, prior in zip(legal, priors)}
+        return np.tanh(self.evaluate() / 3)
+
+    def mcts(self, turn):
+        root = SearchNode(1.0)
+        self.expand(root)
+
+        while time.perf_counter() < self.deadline:
+            node, path, records = root, [root], []
+            passes, ply, ended = 0, turn, False
+
+            while node.children is not None and not ended:
+                self.nodes += 1
+                move, node = self.select_child(node)
+                record, passes, ended = self.play(move, passes, ply)
+                records.append(record)
+                path.append(node)
+                ply += 1
+
+            solved = None if ended else self.solved_value(passes)
+            if ended:
+                value = np.sign(self.final_value())
+            elif solved is not None:
+                value = np.sign(solved)
+            else:
+                value = self.expand(node)
+
+            # value is for the side to move at the leaf, the opponent of
+            # whoever moved into it
+            for visited in reversed(path):
+                value = -value
+                visited.visits += 1
+                visited.value_sum += value
+
+            for record in reversed(records):
+                self.take_back(record)
+
+        return max(root.children.items(), key=lambda item: item[1].visits)[0]
+
+    def select_child(self, node):
+        scale = self.exploration * np.sqrt(node.visits + 1)
+        best, best_score = None, -np.inf
+        for move, child in node.children.items():
+            q = child.value_sum / child.visits if child.visits else 0.0
+            score = q + scale * child.prior / (1 + child.visits)
+            if score > best_score:
+                best, best_score = (move, child), score
+        return best
+
+# Binary game records. Each record is a fixed header followed by one move
+# byte per ply (the index into moves.txt, PASS_MOVE for a pass) and one flag
+# byte per ply (alt moves tried, with the top bit set for an invalid pick).
+# A generation's records are appended to one .games file, and a .idx file
+# holds a (game number, offset) entry for each record.
+GAME_RECORD_MAGIC = b"CGR1"
+GAME_RECORD_VERSION = 1
+GAME_RECORD_HEADER = struct.Struct("<4sBBHIIqqdd")
+GAME_INDEX_ENTRY = np.dtype([("game_number", "<u4"), ("offset", "<u8")])
+GAME_RESULTS = ["Light Won", "Dark Won", "Draw"]
+PASS_MOVE = 255
+
+def game_index_path(filename):
+    return os.path.splitext(filename)[0] + ".idx"
+
+def encode_game_record(generation, game_number, light, dark, log_data, move_table):
+    """
+    Packs a game's log_data into a binary record.
+    """
+    moves = log_data["moves"]
+    move_bytes = bytes(
+        PASS_MOVE if ply_data["move"] == "Pass" else move_table.indices[ply_data["move"]] for ply_data in moves
+    )
+    flag_bytes = bytes(min(ply_data["alt_moves"], 127) | (ply_data["invalid"] << 7) for ply_data in moves)
+    header = GAME_RECORD_HEADER.pack(
+        GAME_RECORD_MAGIC,
+        GAME_RECORD_VERSION,
+        GAME_RESULTS.index(log_data["result"]),
+        len(moves),
+        generation,
+        game_number,
+        light,
+        dark,
+        log_data["fitness_1"],
+        log_data["fitness_2"],
+    )
+    return header + move_bytes + flag_bytes
+
+def decode_game_record(data, move_table):
+    """
+    Unpacks a binary record into a dict shaped like play_game's log_data,
+    replaying the moves to rebuild the final board.
+    """
+    magic, version, result, plies, generation, game_number, light, dark, fitness_1, fitness_2 = \
+        GAME_RECORD_HEADER.unpack_from(data)
+    if magic != GAME_RECORD_MAGIC or version != GAME_RECORD_VERSION:
+        raise ValueError("Not a version 1 game record.")
+
+    start = GAME_RECORD_HEADER.size
+    move_bytes = data[start:start + plies]
+    flag_bytes = data[start + plies:start + 2 * plies]
+
+    game = ColumnsGame(move_table=move_table)
+    moves = []
+    for move_index, flags in zip(move_bytes, flag_bytes):
+        if move_index != PASS_MOVE:
+            game.apply_move(move_index)
+        moves.append({
+            "move": "Pass" if move_index == PASS_MOVE else move_table[move_index].text,
+            "invalid": flags >> 7,
+            "alt_moves": flags & 127,
+        })
+        game.current_player ^= 1
+
+    return {
+        "generation": generation,
+        "game_number": game_number,
+        "result": GAME_RESULTS[result],
+        "light": light,
+        "dark": dark,
+        "fitness_1": fitness_1,
+        "fitness_2": fitness_2,
+        "moves": moves,
+        "game": game,
+    }
+
+class GameRecordFile:
+    """
+    Reads single games out of a generation's .games file using its index,
+    without scanning the records before it.
+    """
+    def __init__(self, filename, move_table=None):
+        self.filename = filename
+        self.move_table = move_table if move_table is not None else get_move_table()
+        self.index = np.fromfile(game_index_path(filename), dtype=GAME_INDEX_ENTRY)
+
+    def game_numbers(self):
+        # A replayed generation (a resume or a rerun into the same directory)
+        # appends its games again; read() returns the newest copy of each
+        return [int(game_number) for game_number in np.unique(self.index["game_number"])]
+
+    def read(self, game_number):
+        found = np.flatnonzero(self.index["game_number"] == game_number)
+        if len(found) == 0:
+            raise KeyError(f"Game {game_number} is not in {self.filename}.")
+
+        with open(self.filename, "rb") as data:
+            data.seek(int(self.index["offset"][found[-1]]))
+            header = data.read(GAME_RECORD_HEADER.size)
+            plies = GAME_RECORD_HEADER.unpack(header)[3]
+            return decode_game_record(header + data.read(2 * plies), self.move_table)
+
+# Endgame tablebase files: a header (magic, piece limit, entry count)
+# followed by TABLEBASE_ENTRY records sorted by key, so a lookup is a binary
+# search over a memory map. value is the final score margin for the side to
+# move under best play and move the index of a best move (PASS_MOVE to pass).
+TABLEBASE_MAGIC = b"CTB1"
+TABLEBASE_HEADER = struct.Struct("<4sIQ")
+TABLEBASE_ENTRY = np.dtype([("key", "<u8"), ("value", "i1"), ("move", "u1")])
+# Folded into the key when the previous move was a pass, since a second
+# pass then ends the game
+TABLEBASE_PASS_PENDING = int(np.random.default_rng(0x7AB1E).integers(1, 2**64, dtype=np.uint64))
+
+class Tablebase:
+    """
+    Exact values for positions with at most max_pieces unplaced pieces left
+    (both sides together). Every move places a piece, so such positions have
+    small finite game trees.
+
+    build() enumerates every position reachable from a set of seed positions
+    and solves them retrograde: positions are visited in order of increasing
+    pieces left, so every successor is solved before the position itself.
+    The turn limit is ignored; with few pieces left games end well before it.
+    """
+    def __init__(self, entries, max_pieces):
+        self.entries = entries
+        self.max_pieces = max_pieces
+
+    @staticmethod
+    def key(state, passes=0):
+        return state.zobrist_hash ^ (TABLEBASE_PASS_PENDING if passes else 0)
+
+    @staticmethod
+    def margin(state):
+        player = state.current_player
+        return state.score[player] - state.score[player ^ 1]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def covers(self, state):
+        return sum(state.counts) <= self.max_pieces
+
+    def lookup(self, state, passes=0):
+        """
+        Returns (value, move) for a ColumnsState, or None if it is not in the
+        table. move is a move-table index, or None for a pass.
+        """
+        if not self.covers(state):
+            return None
+        key = self.key(state, passes)
+        keys = self.entries["key"]
+        i = int(np.searchsorted(keys, key))
+        if i == len(keys) or keys[i] != key:
+            return None
+        move = int(self.entries["move"][i])
+        return int(self.entries["value"][i]), None if move == PASS_MOVE else move
+
+    @classmethod
+    def build(cls, seeds, max_pieces, move_table=None):
+        """
+        Solves every position reachable from the seed ColumnsStates that have
+        at most max_pieces unplaced pieces.
+        """
+        table = move_table if move_table is not None else get_move_table()
+        positions = {}
+        pending = [(seed.clone(), 0) for seed in seeds if sum(seed.counts) <= max_pieces]
+
+        # Forward pass: enumerate positions and their successors
+        while pending:
+            state, passes = pending.pop()
+            key = cls.key(state, passes)
+            if key in positions:
+                continue
+
+            player = state.current_player
+            legal = np.flatnonzero(legal_moves(ColumnsGame(state, table), table))
+            successors = []
+            for move in [int(move) for move in legal] or [PASS_MOVE]:
+                child = state.clone()
+                if move == PASS_MOVE:
+                    child_passes = passes + 1
+                else:
+                    child.place(table[move])
+                    child_passes = 0
+                ended = child_passes >= 2 or not any(child.counts[player * 4:player * 4 + 4])
+                child.current_player = player ^ 1
+
+                if ended:
+                    successors.append((move, None, cls.margin(child)))
+                else:
+                    child_key = cls.key(child, child_passes)
+                    successors.append((move, child_key, 0))
+                    if child_key not in positions:
+                        pending.append((child, child_passes))
+
+            positions[key] = (sum(state.counts), passes, successors)
+
+        # Retrograde pass: fewer pieces first, and a pending pass before none
+        # at the same count, so successors are always solved first
+        solved = {}
+        for key in sorted(positions, key=lambda key: (positions[key][0], -positions[key][1])):
+            best_value, best_move = None, PASS_MOVE
+            for move, child_key, margin in positions[key][2]:
+                value = -(solved[child_key][0] if child_key is not None else margin)
+                if best_value is None or value > best_value:
+                    best_value, best_move = value, move
+            solved[key] = (best_value, best_move)
+
+        entries = np.empty(len(solved), dtype=TABLEBASE_ENTRY)
+        entries["key"] = np.fromiter(solved, dtype=np.uint64, count=len(solved))
+        entries["value"] = [value for value, _ in solved.values()]
+        entries["move"] = [move for _, move in solved.values()]
+        entries.sort(order="key")
+        return cls(entries, max_pieces)
+
+    def save(self, filename):
+        temp_path = filename + ".tmp"
+        with open(temp_path, "wb") as tablebase_file:
+            tablebase_file.write(TABLEBASE_HEADER.pack(TABLEBASE_MAGIC, self.max_pieces, len(self.entries)))
+            tablebase_file.write(self.entries.tobytes())
+        os.replace(temp_path, filename)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Opens a saved tablebase as a read-only memory map.
+        """
+        with open(filename, "rb") as tablebase_file:
+            magic, max_pieces, count = TABLEBASE_HEADER.unpack(tablebase_file.read(TABLEBASE_HEADER.size))
+        if magic != TABLEBASE_MAGIC:
+            raise ValueError(f"{filename} is not a tablebase file.")
+        if count == 0:
+            return cls(np.empty(0, dtype=TABLEBASE_ENTRY), max_pieces)
+        entries = np.memmap(filename, dtype=TABLEBASE_ENTRY, mode="r", offset=TABLEBASE_HEADER.size, shape=(count,))
+        return cls(entries, max_pieces)
+
+# Opening book files: a header (magic, plies covered, entry count) followed
+# by OPENING_BOOK_ENTRY records sorted by (key, move). All the moves seen in
+# a position sit next to each other, found with two binary searches over a
+# memory map. points totals the mover's results (1 win, 0.5 draw).
+OPENING_BOOK_MAGIC = b"COB1"
+OPENING_BOOK_HEADER = struct.Struct("<4sIQ")
+OPENING_BOOK_ENTRY = np.dtype([("key", "<u8"), ("move", "u1"), ("count", "<u4"), ("points", "<f4")])
+
+class OpeningBook:
+    """
+    Move statistics for the opening plies of recorded games, keyed by the
+    position's Zobrist hash.
+    """
+    def __init__(self, entries, plies, min_count=1):
+        self.entries = entries
+        self.plies = plies
+        self.min_count = min_count
+
+    def __len__(self):
+        return len(self.entries)
+
+    def moves(self, state):
+        """
+        Returns the book entries for a ColumnsState (possibly none).
+        """
+        key = state.zobrist_hash
+        keys = self.entries["key"]
+        return self.entries[np.searchsorted(keys, key, "left"):np.searchsorted(keys, key, "right")]
+
+    def choose(self, state):
+        """
+        The most played book move in a position (best scoring on ties), or
+        None if the position is not in the book or no move was played
+        min_count times.
+        """
+        moves = self.moves(state)
+        if len(moves) == 0:
+            return None
+        best = max(range(len(moves)), key=lambda i: (moves["count"][i], moves["points"][i]))
+        if moves["count"][best] < self.min_count:
+            return None
+        return int(moves["move"][best])
+
+    @classmethod
+    def build(cls, games, plies, move_table=None):
+        """
+        Collects the first plies moves of each game.
+
+        Args:
+            games: log_data dicts as returned by GameRecordFile.read.
+            plies: how many opening plies of each game to record.
+        """
+        table = move_table if move_table is not None else get_move_table()
+        stats = {}
+        for log_data in games:
+            light_points = {"Light Won": 1.0, "Dark Won": 0.0, "Draw": 0.5}[log_data["result"]]
+            game = ColumnsGame(move_table=table)
+            for ply_data in log_data["moves"][:plies]:
+                if ply_data["move"] != "Pass":
+                    move_index = table.indices[ply_data["move"]]
+                    entry = stats.setdefault((game.zobrist_hash, move_index), [0, 0.0])
+                    entry[0] += 1
+                    entry[1] += light_points if game.current_player == 0 else 1 - light_points
+                    game.apply_move(move_index)
+                game.current_player ^= 1
+
+        entries = np.empty(len(stats), dtype=OPENING_BOOK_ENTRY)
+        entries["key"] = np.fromiter((key for key, _ in stats), dtype=np.uint64, count=len(stats))
+        entries["move"] = [move for _, move in stats]
+        entries["count"] = [count for count, _ in stats.values()]
+        entries["points"] = [points for _, points in stats.values()]
+        entries.sort(order=["key", "move"])
+        return cls(entries, plies)
+
+    def save(self, filename):
+        temp_path = filename + ".tmp"
+        with open(temp_path, "wb") as book_file:
+            book_file.write(OPENING_BOOK_HEADER.pack(OPENING_BOOK_MAGIC, self.plies, len(self.entries)))
+            book_file.write(self.entries.tobytes())
+        os.replace(temp_path, filename)
+
+    @classmethod
+    def load(cls, filename, min_count=1):
+        """
+        Opens a saved book as a read-only memory map.
+        """
+        with open(filename, "rb") as book_file:
+            magic, plies, count = OPENING_BOOK_HEADER.unpack(book_file.read(OPENING_BOOK_HEADER.size))
+        if magic != OPENING_BOOK_MAGIC:
+            raise ValueError(f"{filename} is not an opening book file.")
+        if count == 0:
+            return cls(np.empty(0, dtype=OPENING_BOOK_ENTRY), plies, min_count)
+        entries = np.memmap(filename, dtype=OPENING_BOOK_ENTRY, mode="r", offset=OPENING_BOOK_HEADER.size, shape=(count,))
+        return cls(entries, plies, min_count)
+
+def genome_content_hash(genome):
+    """
+    Hashes a genome's genes (keys and attribute values, fitness excluded),
+    so unchanged genomes hash the same from one generation to the next.
+    """
+    if isinstance(genome, PackedNetwork):
+        return genome.content_hash
+    digest = hashlib.sha1()
+    for genes in (genome.nodes, genome.connections):
+        for key in sorted(genes):
+            gene = genes[key]
+            values = tuple(getattr(gene, attribute.name) for attribute in gene._gene_attributes)
+            digest.update(repr((key, values)).encode())
+        digest.update(b"|")
+    return digest.hexdigest()
+
+class NetworkCache:
+    """
+    Networks built from genomes, keyed by (genome key, genome content hash),
+    so a genome is built once per generation and elites carried over
+    unchanged keep their network into the next one. update() starts a
+    generation and evicts networks whose genomes are gone.
+    """
+    def __init__(self, build):
+        """
+        Args:
+            build: function(genome, config) returning the network.
+        """
+        self.build = build
+        self.entries = {}
+        self.keys = {}
+        self.used = set()
+        self.built = 0
+        self.reused = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def update(self, genome_map):
+        self.keys = {genome_id: (genome_id, genome_content_hash(genome)) for genome_id, genome in genome_map.items()}
+        live = set(self.keys.values())
+        for key in [key for key in self.entries if key not in live]:
+            del self.entries[key]
+        self.built = 0
+        self.reused = 0
+
+    def get(self, genome, config):
+        key = self.keys.get(genome.key)
+        if key is None:
+            key = (genome.key, genome_content_hash(genome))
+        net = self.entries.get(key)
+        if net is None:
+            net = self.entries[key] = self.build(genome, config)
+            self.built += 1
+        else:
+            self.reused += 1
+        self.used.add(key)
+        return net
+
+    def evict_unused(self):
+        """
+        Drops networks not fetched since the last call, for caches that never
+        see a whole generation's genomes at once (such as a worker's).
+        """
+        for key in [key for key in self.entries if key not in self.used]:
+            del self.entries[key]
+        self.used = set()
+
+class GenomeStore:
+    """
+    Genome checkpoints with one file per generation, genomes/generation_N.ckpt.
+
+    A generation file holds the pickled genomes whose content hash has not
+    been stored before, then a manifest mapping every genome key to its hash
+    and fitness and every hash to the (generation, offset, length) of its
+    pickle. Unchanged genomes are stored by reference to an earlier file, and
+    a single genome can be loaded by reading one manifest and one pickle.
+    """
+    footer = struct.Struct("<4sQ")
+    magic = b"CGS1"
+
+    def __init__(self, directory="genomes"):
+        self.directory = directory
+        self.blobs = None
+        self.manifests = {}
+
+    def path(self, generation):
+        return os.path.join(self.directory, f"generation_{generation}.ckpt")
+
+    def generations(self):
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for name in os.listdir(self.directory):
+            if name.startswith("generation_") and name.endswith(".ckpt"):
+                found.append(int(name[len("generation_"):-len(".ckpt")]))
+        return sorted(found)
+
+    def manifest(self, generation):
+        if generation not in self.manifests:
+            with open(self.path(generation), "rb") as checkpoint:
+                checkpoint.seek(-self.footer.size, os.SEEK_END)
+                magic, offset = self.footer.unpack(checkpoint.read(self.footer.size))
+                if magic != self.magic:
+                    raise ValueError(f"{self.path(generation)} is not a genome checkpoint.")
+                checkpoint.seek(offset)
+                self.manifests[generation] = pickle.load(checkpoint)
+        return self.manifests[generation]
+
+    def save_generation(self, generation, genomes):
+        """
+        Writes a generation's (genome id, genome) pairs, storing only genomes
+        whose content has not been stored before.
+        """
+        if self.blobs is None:
+            # Pick up genomes stored by earlier runs in the same directory
+            self.blobs = {}
+            for earlier in self.generations():
+                if earlier < generation:
+                    self.blobs.update(self.manifest(earlier)["blobs"])
+
+        # Rewriting a generation (a rerun into the same directory, or a resume
+        # from an older checkpoint) makes it and every later file stale, as
+        # later manifests may point into the file being replaced
+        for later in self.generations():
+            if later > generation:
+                os.remove(self.path(later))
+                self.manifests.pop(later, None)
+        self.manifests.pop(generation, None)
+        self.blobs = {content_hash: blob for content_hash, blob in self.blobs.items() if blob[0] < generation}
+
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = {"generation": generation, "genomes": {}, "blobs": {}}
+        temp_path = self.path(generation) + ".tmp"
+
+        with open(temp_path, "wb") as checkpoint:
+            for genome_id, genome in genomes:
+                content_hash = genome_content_hash(genome)
+                if content_hash not in self.blobs and content_hash not in manifest["blobs"]:
+                    data = pickle.dumps(genome, protocol=pickle.HIGHEST_PROTOCOL)
+                    manifest["blobs"][content_hash] = (generation, checkpoint.tell(), len(data))
+                    checkpoint.write(data)
+                elif content_hash not in manifest["blobs"]:
+                    manifest["blobs"][content_hash] = self.blobs[content_hash]
+                manifest["genomes"][genome_id] = (content_hash, genome.fitness)
+
+            offset = checkpoint.tell()
+            pickle.dump(manifest, checkpoint, protocol=pickle.HIGHEST_PROTOCOL)
+            checkpoint.write(self.footer.pack(self.magic, offset))
+
+        os.replace(temp_path, self.path(generation))
+        self.blobs.update(manifest["blobs"])
+        self.manifests[generation] = manifest
+
+    def keys(self, generation):
+        return list(self.manifest(generation)["genomes"])
+
+    def load_genome(self, generation, genome_id):
+        """
+        Loads one genome as it was in the given generation, fitness included.
+        """
+        content_hash, fitness = self.manifest(generation)["genomes"][genome_id]
+        stored_in, offset, length = self.manifest(generation)["blobs"][content_hash]
+
+        with open(self.path(stored_in), "rb") as checkpoint:
+            checkpoint.seek(offset)
+            genome = pickle.loads(checkpoint.read(length))
+
+        # The pickle may come from an earlier generation, so restore this
+        # generation's key and fitness
+        genome.key = genome_id
+        genome.fitness = fitness
+        return genome
+
+class GameLogger:
+    """
+    Queues log writes and hands them to a background thread, which drains
+    whatever has built up and writes it with one open and one write per
+    file. Training only waits on the filesystem if the queue fills up.
+
+    Verbosity controls which games are logged: "off" logs none, "sampled"
+    logs every sample_every-th game and "full" logs them all.
+    """
+    def __init__(self, verbosity="full", sample_every=100, max_pending=10000):
+        if verbosity not in ["off", "sampled", "full"]:
+            raise ValueError(f"Unknown log verbosity '{verbosity}'.")
+        self.verbosity = verbosity
+        self.sample_every = max(1, sample_every)
+        self.max_pending = max_pending
+
+        # When set to a list, writes are collected there instead of queued,
+        # so worker processes can hand their records back to the parent
+        self.records = None
+
+        self.queue = None
+        self.thread = None
+        self.pid = None
+        # The writer thread's first failure, raised by the next write or flush
+        self.error = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(queue=None, thread=None, pid=None, error=None)
+        return state
+
+    @property
+    def enabled(self):
+        return self.verbosity != "off"
+
+    def should_log(self, game_number):
+        if self.verbosity == "full":
+            return True
+        if self.verbosity == "sampled":
+            return game_number % self.sample_every == 0
+        return False
+
+    def write(self, filename, text, mode="a"):
+        """
+        Queues text to be appended ("a") or written ("w") to filename. With
+        mode "record", text is a (game number, bytes) game record to append
+        to a .games file and its index.
+        """
+        if self.records is not None:
+            self.records.append((filename, text, mode))
+            return
+
+        if self.pid != os.getpid():
+            # First write in this process: start a writer thread of our own
+            self.queue = queue.Queue(self.max_pending)
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.pid = os.getpid()
+            self.thread.start()
+            atexit.register(self.flush)
+
+        self.raise_error()
+        self.queue.put((filename, text, mode))
+
+    def flush(self):
+        """
+        Blocks until every queued write has reached disk.
+        """
+        if self.pid == os.getpid():
+            self.queue.join()
+            self.raise_error()
+
+    def raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def run(self):
+        made_dirs = set()
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self.write_batch(batch, made_dirs)
+            except Exception as error:
+                # Keep the thread alive so flush() and a full queue don't hang
+                if self.error is None:
+                    self.error = error
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def write_batch(self, batch, made_dirs):
+        # Merge the batch per file, keeping order; a "w" drops earlier appends
+        pending = {}
+        for filename, text, mode in batch:
+            if mode == "w" or filename not in pending:
+                pending[filename] = (mode, [text])
+            else:
+                pending[filename][1].append(text)
+
+        for filename, (mode, texts) in pending.items():
+            directory = os.path.dirname(filename)
+            if directory and directory not in made_dirs:
+                os.makedirs(directory, exist_ok=True)
+                made_dirs.add(directory)
+            if mode == "record":
+                self.write_records(filename, texts)
+            else:
+                with open(filename, mode) as log:
+                    log.write("".join(texts))
+
+    def write_records(self, filename, records):
+        entries = np.empty(len(records), dtype=GAME_INDEX_ENTRY)
+        with open(filename, "ab") as data:
+            for i, (game_number, record) in enumerate(records):
+                entries[i] = (game_number, data.tell())
+                data.write(record)
+        with open(game_index_path(filename), "ab") as index:
+            index.write(entries.tobytes())
+
+class PairingScheduler:
+    """
+    Decides who plays whom during a generation. rounds() yields lists of
+    (light genome id, dark genome id) pairings; each round is played and
+    merged into results before the next one is requested.
+    """
+    def rounds(self, genomes, results, rng):
+        raise NotImplementedError
+
+    def reference_genomes(self):
+        """
+        Extra (genome id, genome) opponents that play but are not scored.
+        """
+        return []
+
+    def end_generation(self, genomes):
+        pass
+
+class RoundRobinScheduler(PairingScheduler):
+    """
+    Every unordered pair once, with Light going to the genome that comes
+    first in the population.
+    """
+    def rounds(self, genomes, results, rng):
+        yield [
+            (genome_id1, genome_id2)
+            for i, (genome_id1, _) in enumerate(genomes)
+            for genome_id2, _ in genomes[i + 1:]
+        ]
+
+class RandomOpponentsScheduler(PairingScheduler):
+    """
+    Each genome challenges k distinct random opponents, with random
+    colours, so every genome plays at least k games.
+    """
+    def __init__(self, opponents):
+        self.opponents = opponents
+
+    def rounds(self, genomes, results, rng):
+        genome_ids = [genome_id for genome_id, _ in genomes]
+        seen = set()
+        pairings = []
+        for genome_id in genome_ids:
+            others = [other for other in genome_ids if other != genome_id]
+            for other in rng.sample(others, min(self.opponents, len(others))):
+                if frozenset((genome_id, other)) in seen:
+                    continue
+                seen.add(frozenset((genome_id, other)))
+                pairings.append((genome_id, other) if rng.random() < 0.5 else (other, genome_id))
+        yield pairings
+
+class SwissScheduler(PairingScheduler):
+    """
+    Swiss-system rounds: genomes are ranked by fitness per game so far and
+    paired with the nearest-ranked genome they have not met yet. Whoever has
+    had Light less often takes Light. An odd genome out sits the round out.
+    """
+    def __init__(self, num_rounds):
+        self.num_rounds = num_rounds
+
+    def rounds(self, genomes, results, rng):
+        genome_ids = [genome_id for genome_id, _ in genomes]
+        met = set()
+        light_games = dict.fromkeys(genome_ids, 0)
+
+        for _ in range(self.num_rounds):
+            # Shuffle first so ties in the standings are broken at random
+            order = genome_ids[:]
+            rng.shuffle(order)
+            order.sort(key=lambda genome_id: -results[genome_id]["fitness"] / max(1, results[genome_id]["games"]))
+
+            pairings = []
+            while len(order) > 1:
+                genome_id1 = order.pop(0)
+                partner = next((n for n, other in enumerate(order) if frozenset((genome_id1, other)) not in met), 0)
+                genome_id2 = order.pop(partner)
+                met.add(frozenset((genome_id1, genome_id2)))
+
+                if light_games[genome_id2] < light_games[genome_id1]:
+                    genome_id1, genome_id2 = genome_id2, genome_id1
+                light_games[genome_id1] += 1
+                pairings.append((genome_id1, genome_id2))
+            yield pairings
+
+class HallOfFameScheduler(PairingScheduler):
+    """
+    Every genome plays each member of a fixed panel of earlier champions,
+    taking Light and Dark in turn. The best genome of each generation joins
+    the panel, replacing the oldest once it is full. Until the panel has a
+    member, genomes play random opponents from their own generation.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.panel = []
+        self.next_id = -1
+
+    def reference_genomes(self):
+        return self.panel
+
+    def rounds(self, genomes, results, rng):
+        if not self.panel:
+            yield from RandomOpponentsScheduler(self.size).rounds(genomes, results, rng)
+            return
+
+        pairings = []
+        for i, (genome_id, _) in enumerate(genomes):
+            for j, (reference_id, _) in enumerate(self.panel):
+                pairings.append((genome_id, reference_id) if (i + j) % 2 == 0 else (reference_id, genome_id))
+        yield pairings
+
+    def end_generation(self, genomes):
+        best = max((genome for _, genome in genomes), key=lambda genome: genome.fitness)
+        champion = copy.deepcopy(best)
+        # Panel members get negative ids so they never clash with the population
+        champion.key = self.next_id
+        self.next_id -= 1
+        self.panel = (self.panel + [(champion.key, champion)])[-self.size:]
+
+def make_scheduler(settings):
+    if settings.scheduler == "round_robin":
+        return RoundRobinScheduler()
+    if settings.scheduler == "random":
+        return RandomOpponentsScheduler(settings.opponents)
+    if settings.scheduler == "swiss":
+        return SwissScheduler(settings.swiss_rounds)
+    if settings.scheduler == "hall_of_fame":
+        return HallOfFameScheduler(settings.hall_of_fame_size)
+    raise ValueError(f"Unknown scheduler '{settings.scheduler}'.")
+
+class Profiler:
+    """
+    Per-generation timings and counters for the self-play hot path. Callers
+    test enabled before timing a section and hand the section's start time
+    to lap(), which returns the time to start the next one from, so a
+    disabled profiler costs one attribute test per section.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.seconds = {}
+        self.calls = {}
+        self.counters = {"games": 0, "plies": 0, "picks": 0, "invalid_moves": 0}
+
+    def lap(self, section, started):
+        now = time.perf_counter()
+        self.seconds[section] = self.seconds.get(section, 0.0) + now - started
+        self.calls[section] = self.calls.get(section, 0) + 1
+        return now
+
+    def count(self, counter, amount=1):
+        self.counters[counter] += amount
+
+    def take(self):
+        """
+        Returns the totals so far and starts again from zero, for worker
+        processes to hand their share back to the parent.
+        """
+        totals = (self.seconds, self.calls, self.counters)
+        self.reset()
+        return totals
+
+    def merge(self, totals):
+        seconds, calls, counters = totals
+        for section, elapsed in seconds.items():
+            self.seconds[section] = self.seconds.get(section, 0.0) + elapsed
+            self.calls[section] = self.calls.get(section, 0) + calls[section]
+        for counter, amount in counters.items():
+            self.counters[counter] += amount
+
+class ProfilingReporter(neat.reporting.BaseReporter):
+    """
+    NEAT reporter that appends one JSON line of Profiler metrics per
+    generation to filename: seconds and calls per hot-path section,
+    games/sec, plies/sec and the invalid-move rate.
+    """
+    def __init__(self, profiler, filename="metrics.jsonl"):
+        self.profiler = profiler
+        self.filename = filename
+        self.generation = None
+        self.started = None
+        self.evaluation_seconds = 0.0
+
+    def start_generation(self, generation):
+        self.generation = generation
+        self.profiler.reset()
+        self.started = time.perf_counter()
+
+    def post_evaluate(self, config, population, species, best_genome):
+        self.evaluation_seconds = time.perf_counter() - self.started
+
+    def end_generation(self, config, population, species_set):
+        counters = self.profiler.counters
+        seconds = self.evaluation_seconds or float("inf")
+        metrics = {
+            "generation": self.generation,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "generation_seconds": time.perf_counter() - self.started,
+            "evaluation_seconds": self.evaluation_seconds,
+            "sections": {
+                section: {"seconds": elapsed, "calls": self.profiler.calls[section]}
+                for section, elapsed in sorted(self.profiler.seconds.items())
+            },
+            "games": counters["games"],
+            "plies": counters["plies"],
+            "games_per_sec": counters["games"] / seconds,
+            "plies_per_sec": counters["plies"] / seconds,
+            "invalid_move_rate": counters["invalid_moves"] / counters["picks"] if counters["picks"] else 0.0,
+        }
+        with open(self.filename, "a") as metrics_file:
+            metrics_file.write(json.dumps(metrics) + "\n")
+
+def split_counter(counter):
+    """
+    Returns the next value of an itertools.count and a fresh counter that
+    continues from it, so the position can be saved without pickling the
+    counter itself.
+    """
+    value = next(counter)
+    return value, itertools.count(value)
+
+class TrainingCheckpointer(neat.reporting.BaseReporter):
+    """
+    Saves everything needed to carry on training (see
+    AiEngine.training_state) every `every` generations to
+    directory/checkpoint_N.pkl.gz, where N is the next generation to
+    evaluate. The state is pickled at the end of the generation so it is
+    consistent; compressing and writing it (to a temporary file that is then
+    renamed into place) happen on a background thread while the next
+    generation runs. Only the newest `keep` checkpoints are kept.
+    """
+    prefix = "checkpoint_"
+    suffix = ".pkl.gz"
+
+    def __init__(self, engine, directory="checkpoints", every=1, keep=3):
+        self.engine = engine
+        self.directory = directory
+        self.every = every
+        self.keep = keep
+        self.queue = queue.Queue()
+        self.thread = None
+        # The writer thread's first failure, raised by the next checkpoint or flush
+        self.error = None
+
+    def end_generation(self, config, population, species_set):
+        self.raise_error()
+        generation = self.engine.population.generation + 1
+        if generation % self.every:
+            return
+
+        data = pickle.dumps(self.engine.training_state(generation), protocol=pickle.HIGHEST_PROTOCOL)
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="TrainingCheckpointer", daemon=True)
+            self.thread.start()
+            atexit.register(self.flush)
+        self.queue.put((generation, data))
+
+    def run(self):
+        while True:
+            generation, data = self.queue.get()
+            try:
+                self.write(generation, data)
+            except Exception as error:
+                # Keep the thread alive so later checkpoints and flush() don't hang
+                if self.error is None:
+                    self.error = error
+            finally:
+                self.queue.task_done()
+
+    def path(self, generation):
+        return os.path.join(self.directory, f"{self.prefix}{generation}{self.suffix}")
+
+    def write(self, generation, data):
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self.path(generation) + ".tmp"
+        with open(temp_path, "wb") as checkpoint_file:
+            with gzip.GzipFile(fileobj=checkpoint_file, mode="wb", compresslevel=5) as compressed:
+                compressed.write(data)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temp_path, self.path(generation))
+
+        for old_generation, old_path in self.checkpoints(self.directory)[:-self.keep]:
+            os.remove(old_path)
+
+    def flush(self):
+        """
+        Waits for queued checkpoints to be written.
+        """
+        self.queue.join()
+        self.raise_error()
+
+    def raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    @classmethod
+    def checkpoints(cls, directory):
+        """
+        Returns (generation, path) for every checkpoint in directory, oldest first.
+        """
+        if not os.path.isdir(directory):
+            return []
+        found = []
+        for name in os.listdir(directory):
+            if name.startswith(cls.prefix) and name.endswith(cls.suffix):
+                found.append((int(name[len(cls.prefix):-len(cls.suffix)]), os.path.join(directory, name)))
+        return sorted(found)
+
+    @staticmethod
+    def load(path):
+        with gzip.open(path, "rb") as checkpoint_file:
+            return pickle.loads(checkpoint_file.read())
+
+class EvaluationSettings:
+    """
+    Settings for the evaluation loop, read from the optional [Evaluation]
+    section of the NEAT config file. Missing options keep their defaults.
+    """
+    defaults = {
+        "workers": 1,
+        "move_selection": "retry",
+        "lockstep": False,
+        "lockstep_games": 4096,
+        "log_verbosity": "full",
+        "log_sample_every": 100,
+        "scheduler": "round_robin",
+        "opponents": 10,
+        "swiss_rounds": 7,
+        "hall_of_fame_size": 10,
+        "normalise_fitness": False,
+        "seed": 0,
+        "paired": False,
+        "activation_cache_size": 1024,
+        "search": "alphabeta",
+        "search_time": 1.0,
+        "tablebase": "",
+        "opening_book": "",
+        "opening_book_min_count": 2,
+        "opening_book_evaluation": False,
+        "profile": False,
+        "profile_file": "metrics.jsonl",
+        "distributed": False,
+        "coordinator_host": "127.0.0.1",
+        "coordinator_port": 5757,
+        "local_workers": 0,
+        "distributed_task_games": 16,
+        "distributed_task_timeout": 600.0,
+    }
+
+    # Settings naming files to read, as opposed to outputs
+    input_paths = ("tablebase", "opening_book")
+
     def __init__(self, config_file):
+        parser = configparser.ConfigParser(inline_comment_prefixes=("#",))
+        parser.read(config_file)
+
+        for name, default in self.defaults.items():
+            value = default
+            if parser.has_option("Evaluation", name):
+                if isinstance(default, bool):
+                    value = parser.getboolean("Evaluation", name)
+                elif isinstance(default, int):
+                    value = parser.getint("Evaluation", name)
+                elif isinstance(default, float):
+                    value = parser.getfloat("Evaluation", name)
+                else:
+                    value = parser.get("Evaluation", name).strip()
+            setattr(self, name, value)
+
+    def override(self, name, text):
+        """
+        Sets a setting from a string (e.g. a command-line value), converting
+        it like the config file would.
+        """
+        if name not in self.defaults:
+            raise ValueError(f"Unknown evaluation setting '{name}'.")
+        default = self.defaults[name]
+        if isinstance(default, bool):
+            value = configparser.ConfigParser.BOOLEAN_STATES.get(str(text).lower())
+            if value is None:
+                raise ValueError(f"Not a boolean for '{name}': {text!r}.")
+        elif isinstance(default, (int, float)):
+            value = type(default)(text)
+        else:
+            value = str(text)
+        setattr(self, name, value)
+
+_worker_engine = None
+
+def _init_worker(engine):
+    global _worker_engine
+    _worker_engine = engine
+
+    # Networks are kept across tasks; see _play_pairings
+    engine.networks = NetworkCache(engine.create_network)
+    engine.networks_generation = None
+
+def _play_pairings(task):
+    """
+    Plays a share of the round-robin inside a worker process.
+
+    Networks are built once per genome in each worker and kept in its
+    NetworkCache across tasks and rounds. At each new generation the ones not
+    used during the last are dropped, so unchanged elites keep theirs.
+
+    Args:
+        task: (generation, genomes, pairings) where genomes maps genome id to
+              the genome packed with encode_network and pairings is a list of
+              (game_number, genome_id1, genome_id2).
+
+    Returns:
+        (games, cache_stats, profile): games holds (game_number, genome_id1,
+        genome_id2, result, records) for every game played, where records are
+        the game's log writes for the parent's logger. cache_stats is the
+        task's activation cache (hits, misses) and profile its Profiler totals.
+    """
+    generation, genomes, pairings = task
+    _worker_engine.generation = generation
+    if _worker_engine.networks_generation != generation:
+        _worker_engine.networks.evict_unused()
+        _worker_engine.networks_generation = generation
+
+    genomes = {genome_id: decode_network(data) for genome_id, data in genomes.items()}
+    nets = {}
+    games = []
+
+    for game_number, genome_id1, genome_id2 in pairings:
+        for genome_id in (genome_id1, genome_id2):
+            if genome_id not in nets:
+                nets[genome_id] = _worker_engine.networks.get(genomes[genome_id], _worker_engine.config)
+
+        genome1 = genomes[genome_id1]
+        genome2 = genomes[genome_id2]
+
+        game_log = {"moves": []}
+        _worker_engine.logger.records = []
+        result = _worker_engine.play_game(
+            genome1,
+            nets[genome_id1],
+            genome2,
+            nets[genome_id2],
+            generation=_worker_engine.generation,
+            game_number=game_number,
+            log_data=game_log,
+        )
+        _worker_engine.log_game(_worker_engine.generation, game_number, genome1, genome2, game_log)
+
+        games.append((game_number, genome_id1, genome_id2, {
+            "result": result["result"],
+            "fitness_1": result["fitness_1"],
+            "fitness_2": result["fitness_2"],
+            "invalid_moves_1": result["invalid_moves_1"],
+            "invalid_moves_2": result["invalid_moves_2"],
+        }, _worker_engine.logger.records))
+
+    return games, _worker_engine.cache_stats(nets.values()), _worker_engine.profiler.take()
+
+def _lockstep_worker(engine, tasks, replies):
+    """
+    Runs in a SharedSelfPlayPool process: plays its share of each lockstep
+    batch in place in shared memory, answering with its profiler totals.
+    """
+    activation_defs = engine.config.genome_config.activation_defs
+    networks = nets = None
+    try:
+        while True:
+            message = tasks.get()
+            if message is None:
+                return
+            kind, payload = message
+            try:
+                if kind == "networks":
+                    name, layout, structures = payload
+                    nets = None
+                    if networks is not None:
+                        networks.close()
+                    networks = SharedArrays.attach(name, layout)
+                    nets = {
+                        n: CompiledNetwork.from_shared(structure, networks.arrays, activation_defs)
+                        for n, structure in enumerate(structures)
+                    }
+                else:
+                    name, layout, lo, hi = payload
+                    games = SharedArrays.attach(name, layout)
+                    LockstepSelfPlay(engine, nets, arrays={key: array[lo:hi] for key, array in games.arrays.items()}).play()
+                    games.close()
+                    replies.put(("done", engine.profiler.take()))
+            except Exception:
+                replies.put(("error", traceback.format_exc()))
+    finally:
+        nets = None
+        if networks is not None:
+            networks.close()
+
+MESSAGE_HEADER = struct.Struct("<Q")
+
+def send_message(sock, message):
+    """
+    Sends a length-prefixed pickle. Only connect coordinators and workers
+    you trust: unpickling runs whatever the sender puts in a message.
+    """
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(MESSAGE_HEADER.pack(len(data)) + data)
+
+def recv_message(sock):
+    (length,) = MESSAGE_HEADER.unpack(_recv_exactly(sock, MESSAGE_HEADER.size))
+    return pickle.loads(_recv_exactly(sock, length))
+
+def _recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(min(size - len(data), 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed.")
+        data += chunk
+    return bytes(data)
+
+class EvaluationCoordinator:
+    """
+    Hands out evaluation tasks to worker processes connected over TCP, which
+    may run on other hosts (python main.py --worker HOST:PORT) or be started
+    here with local_workers.
+
+    Each worker is sent the pickled engine once when it connects, then one
+    (generation, genomes, pairings) task at a time, answering with
+    _play_pairings' result. A task whose worker drops, or stays silent for
+    distributed_task_timeout seconds, is queued again for the others. Per-worker games and busy time are kept in
+    stats for the generation report.
+    """
+    def __init__(self, engine, host, port, local_workers=0):
+        # Pickle here rather than per connection, while the engine is not
+        # being changed by the training loop
+        self.engine_data = pickle.dumps(engine, protocol=pickle.HIGHEST_PROTOCOL)
+        self.task_timeout = engine.settings.distributed_task_timeout or None
+        self.server = socket.create_server((host, port))
+        self.address = self.server.getsockname()[:2]
+        self.tasks = queue.Queue()
+        self.replies = queue.Queue()
+        self.lock = threading.Lock()
+        self.connected = 0
+        self.stats = {}  # worker address -> [games, busy seconds]
+
+        threading.Thread(target=self.accept, daemon=True).start()
+        print(f"Coordinator listening on {self.address[0]}:{self.address[1]}")
+
+        self.local_workers = []
+        for _ in range(local_workers):
+            process = multiprocessing.Process(target=run_worker, args=self.address, daemon=True)
+            process.start()
+            self.local_workers.append(process)
+
+    def accept(self):
+        while True:
+            try:
+                conn, address = self.server.accept()
+            except OSError:
+                return  # Closed
+            threading.Thread(target=self.serve, args=(conn, f"{address[0]}:{address[1]}"), daemon=True).start()
+
+    def serve(self, conn, name):
+        # A host that loses power or network sends no FIN or RST, so without
+        # these recv would wait forever and its task would never be requeued
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        conn.settimeout(self.task_timeout)
+        with conn:
+            try:
+                send_message(conn, ("engine", self.engine_data))
+            except OSError:
+                return
+            with self.lock:
+                self.connected += 1
+                self.stats.setdefault(name, [0, 0.0])
+
+            try:
+                while True:
+                    task = self.tasks.get()
+                    if task is None:
+                        send_message(conn, ("stop", None))
+                        return
+                    task_id, generation, genomes, pairings = task
+
+                    started = time.perf_counter()
+                    try:
+                        send_message(conn, ("task", (generation, genomes, pairings)))
+                        kind, reply = recv_message(conn)
+                    except (OSError, EOFError, pickle.UnpicklingError):
+                        print(f"Worker {name} dropped; requeueing its task")
+                        self.tasks.put(task)
+                        return
+
+                    with self.lock:
+                        self.stats[name][0] += len(pairings)
+                        self.stats[name][1] += time.perf_counter() - started
+                    self.replies.put((task_id, kind, reply))
+            except OSError:
+                pass
+            finally:
+                with self.lock:
+                    self.connected -= 1
+
+    def play(self, tasks):
+        """
+        Plays (generation, genomes, pairings) tasks on the connected workers,
+        waiting for workers to connect if there are none.
+
+        Returns:
+            list: each task's _play_pairings result, in task order.
+        """
+        for task_id, task in enumerate(tasks):
+            self.tasks.put((task_id, *task))
+
+        replies = {}
+        while len(replies) < len(tasks):
+            try:
+                task_id, kind, reply = self.replies.get(timeout=10)
+            except queue.Empty:
+                if not self.connected:
+                    print(f"Waiting for workers on {self.address[0]}:{self.address[1]}")
+                continue
+            if kind == "error":
+                raise RuntimeError(f"Worker failed a task:\n{reply}")
+            replies[task_id] = reply
+        return [replies[task_id] for task_id in range(len(tasks))]
+
+    def reset_stats(self):
+        with self.lock:
+            for worker_stats in self.stats.values():
+                worker_stats[:] = [0, 0.0]
+
+    def close(self):
+        """
+        Stops accepting workers and tells the connected ones to exit.
+        """
+        self.server.close()
+        with self.lock:
+            connected = self.connected
+        for _ in range(connected):
+            self.tasks.put(None)
+        for process in self.local_workers:
+            process.join(timeout=10)
+
+def run_worker(host, port, retry_seconds=30):
+    """
+    Connects to an EvaluationCoordinator and plays the tasks it hands out
+    until it says stop or goes away. Connecting is retried for
+    retry_seconds, so workers can be started before the coordinator.
+    """
+    deadline = time.monotonic() + retry_seconds
+    while True:
+        try:
+            conn = socket.create_connection((host, int(port)))
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+
+    with conn:
+        _, engine_data = recv_message(conn)
+        _init_worker(pickle.loads(engine_data))
+        while True:
+            try:
+                kind, task = recv_message(conn)
+            except (OSError, EOFError):
+                return
+            if kind == "stop":
+                return
+
+            try:
+                reply = ("result", _play_pairings(task))
+            except Exception:
+                reply = ("error", traceback.format_exc())
+            send_message(conn, reply)
+
+class AiEngine:
+    def __init__(self, config_file, moves_file=None, overrides=None):
+        """
+        Args:
+            config_file: The NEAT config file, with an optional [Evaluation] section.
+            moves_file: moves.txt to use; found with find_data_file by default.
+            overrides: {setting name: value string} applied over [Evaluation].
+        """
         self.config_file = config_file
         self.config = neat.Config(
             neat.DefaultGenome,
@@ -219,15 +3003,71 @@ class AiEngine:
             neat.DefaultStagnation,
             self.config_file
         )
+
+        self.settings = EvaluationSettings(self.config_file)
+        for name, value in (overrides or {}).items():
+            self.settings.override(name, value)
+
         self.population = neat.Population(self.config)
-        self.population.add_reporter(neat.StdOutReporter(True))
-        self.stats = neat.StatisticsReporter()
-        self.population.add_reporter(self.stats)
+        self.profiler = Profiler(self.settings.profile)
+        self.add_reporters()
 
+        self.logger = GameLogger(self.settings.log_verbosity, self.settings.log_sample_every)
+        self.genome_store = GenomeStore("genomes")
+        self.scheduler = make_scheduler(self.settings)
         self.generation = 0
 
-        with open("moves.txt", "r") as file:
-            self.all_moves = [line.strip() for line in file.readlines()]
+        # Reused by every play_game call in this process
+        self.inputs = np.empty(68)
+
+        # Activation cache totals for the current generation
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        self._opening_book = None
+
+        # Networks kept across the round-robin and across generations
+        self.networks = NetworkCache(self.create_network)
+        self.compiled_networks = NetworkCache(CompiledNetwork.create)
+
+        # Started by the first parallel evaluation
+        self.worker_pool = None
+        # Started by the first distributed evaluation
+        self.coordinator = None
+        # Started by the first lockstep evaluation with workers > 1
+        self.selfplay_pool = None
+
+        # Parse moves.txt once; the hot loop works on indices into this table
+        self.move_table = get_move_table(moves_file)
+        self.all_moves = list(self.move_table.texts)
+
+        if self.settings.move_selection not in ["retry", "nearest", "masked"]:
+            raise ValueError(f"Unknown move_selection '{self.settings.move_selection}'.")
+
+        # retry_rank[i, j] is the position of move j in the retry order for move i
+        self.retry_rank = np.empty((len(self.all_moves), len(self.all_moves)), dtype=np.int64)
+        for i in range(len(self.all_moves)):
+            self.retry_rank[i, self.nearest_move_indices(i)] = np.arange(len(self.all_moves))
+
+    def add_reporters(self):
+        self.population.add_reporter(neat.StdOutReporter(True))
+        self.stats = neat.StatisticsReporter()
+        self.population.add_reporter(self.stats)
+        if self.settings.profile:
+            self.population.add_reporter(ProfilingReporter(self.profiler, self.settings.profile_file))
+
+    def __getstate__(self):
+        # Worker processes only play games, so leave the NEAT population behind
+        state = self.__dict__.copy()
+        state["population"] = None
+        state["stats"] = None
+        state["_opening_book"] = None  # Workers map the file themselves
+        state["networks"] = None  # Workers build their own networks per task
+        state["compiled_networks"] = None
+        state["worker_pool"] = None
+        state["coordinator"] = None
+        state["selfplay_pool"] = None
+        return state
 
     def next_nearest_move(self, move):
         """
@@ -245,8 +3085,14 @@ class AiEngine:
         if move not in self.all_moves:
             raise ValueError(f"Move '{move}' not found in moves.txt.")
         
-        move_index = self.all_moves.index(move)
-        nearest_moves = [move]  # Start with the given move
+        return [self.all_moves[i] for i in self.nearest_move_indices(self.all_moves.index(move))]
+
+    def nearest_move_indices(self, move_index):
+        """
+        Index form of next_nearest_move: the given index followed by the
+        indices above and below it, alternating outwards.
+        """
+        nearest_moves = [move_index]  # Start with the given move
         
         # Alternating above and below indices
         offset = 1
@@ -255,12 +3101,12 @@ class AiEngine:
 
             # Check move above
             if move_index - offset >= 0:
-                nearest_moves.append(self.all_moves[move_index - offset])
+                nearest_moves.append(move_index - offset)
                 added_any = True
 
             # Check move below
             if move_index + offset < len(self.all_moves):
-                nearest_moves.append(self.all_moves[move_index + offset])
+                nearest_moves.append(move_index + offset)
                 added_any = True
 
             # Break if no moves are added (bounds reached)
@@ -271,36 +3117,83 @@ class AiEngine:
 
         return nearest_moves
 
+    def select_legal_move(self, game, output, move_index):
+        """
+        Picks a replacement for an illegal move in one step from the legal-move
+        mask. With move_selection = nearest this is the move the retry loop
+        would have reached; with masked it is the legal move the network rates
+        highest.
+
+        Returns:
+            (alt_index, alt_moves): the chosen move index, or None if there is no
+            legal move, and the number of moves the retry loop would have tried.
+        """
+        mask = legal_moves(game, self.move_table)
+        if not mask.any():
+            return None, len(mask)
+
+        if self.settings.move_selection == "masked":
+            alt_index = int(np.argmax(np.where(mask, output, -np.inf)))
+        else:
+            alt_index = int(np.argmin(np.where(mask, self.retry_rank[move_index], len(mask))))
+
+        return alt_index, int(self.retry_rank[move_index, alt_index]) + 1
+
+    @property
+    def opening_book(self):
+        """
+        The OpeningBook named by the opening_book setting, mapped on first
+        use, or None if there is none.
+        """
+        if self._opening_book is None and self.settings.opening_book:
+            self._opening_book = OpeningBook.load(self.settings.opening_book, self.settings.opening_book_min_count)
+        return self._opening_book
+
+    def create_network(self, genome, config):
+        """
+        Builds the network play_game uses for a genome (or a PackedNetwork),
+        behind an ActivationCache unless activation_cache_size is 0.
+        """
+        if isinstance(genome, PackedNetwork):
+            net = genome.feed_forward(config.genome_config)
+        else:
+            net = neat.nn.FeedForwardNetwork.create(genome, config)
+        if self.settings.activation_cache_size > 0:
+            net = ActivationCache(net, self.settings.activation_cache_size)
+        return net
+
+    @staticmethod
+    def cache_stats(nets):
+        """
+        Sums (hits, misses) over the activation caches among nets and resets
+        their counters, since cached networks outlive a round.
+        """
+        hits = misses = 0
+        for net in nets:
+            if isinstance(net, ActivationCache):
+                hits += net.hits
+                misses += net.misses
+                net.hits = net.misses = 0
+        return hits, misses
+
     def encode_state(self, game):
         """
         Encodes the game state into a 68-input array for the NEAT network.
         """
-        input_data = []
+        return self.encode_state_into(game, np.empty(68, dtype=np.int64))
 
-        # Encode board (12 columns, 5 rows per column)
-        for column in game.board:
-            for level in range(game.stack_height):
-                if level < len(column.stack):
-                    piece = column.stack[level]
-                    if piece == "Lr":
-                        input_data.append(1)
-                    elif piece == "Lb":
-                        input_data.append(2)
-                    elif piece == "Dr":
-                        input_data.append(3)
-                    elif piece == "Db":
-                        input_data.append(4)
-                else:
-                    input_data.append(0)
-
-        # Encode unplaced pieces
-        for player in game.players:
-            input_data.append(game.pieces[player]["roundels"])
-            input_data.append(game.pieces[player]["blockers"])
-            input_data.append(game.pieces[player]["d-blockers"])
-            input_data.append(game.pieces[player]["l-blockers"])
+    def encode_state_into(self, game, out):
+        """
+        Writes the 68 network inputs for a game into out, which may be a
+        preallocated buffer or a row of a batch matrix, without allocating.
 
-        return np.array(input_data)
+        Board cells hold piece codes that double as input values (see PIECES)
+        and moves update them in place, so the board portion is a straight
+        copy of the cell buffer followed by the unplaced piece counters.
+        """
+        np.copyto(out[:60], game.cell_codes)
+        np.copyto(out[60:68], game.piece_counts)
+        return out
 
     def decode_output(self, output):
         """
@@ -312,21 +3205,22 @@ class AiEngine:
         Returns:
             The corresponding move string from moves.txt.
         """
+        return self.all_moves[self.decode_move_index(output)]
+
+    def decode_move_index(self, output):
+        """
+        Returns the index into the move table of the highest-probability
+        softmax output.
+        """
         # Apply softmax to the output
         probabilities = softmax(output)
         
         # Find the index of the highest probability
-        move_index = np.argmax(probabilities)
+        move_index = int(np.argmax(probabilities))
+        if not 0 <= move_index < len(self.all_moves):
+            raise ValueError(f"Invalid move index {move_index}. Ensure moves.txt has enough entries.")
         
-        # Read the move string from moves.txt at the corresponding line
-        with open("moves.txt", "r") as file:
-            moves = file.readlines()
-            if 0 <= move_index < len(moves):
-                move_str = moves[move_index].strip()  # Strip to remove newlines
-            else:
-                raise ValueError(f"Invalid move index {move_index}. Ensure moves.txt has enough entries.")
-        
-        return move_str
+        return move_index
 
     def write_generation_report(self, genomes, generation, results):
         """
@@ -337,130 +3231,172 @@ class AiEngine:
 
         with open(filename, "w") as report:
             report.write(f"GENERATION {generation}\n\n")
-            report.write("Genome ID | Fitness | Invalid | Wins | Draws | Losses\n")
-            report.write("-" * 50 + "\n")
+            if self.settings.paired:
+                report.write("Genome ID | Fitness | Invalid | Wins | Draws | Losses | Games | Pair Wins | Pair Draws | Pair Losses\n")
+                report.write("-" * 98 + "\n")
+            else:
+                report.write("Genome ID | Fitness | Invalid | Wins | Draws | Losses | Games\n")
+                report.write("-" * 62 + "\n")
 
             for genome_id, data in results.items():
+                line = f"{genome_id:9} | {data['fitness']:5.3f} | {data['invalid_moves']:9} | {data['wins']:9} | {data['draws']:9} | {data['losses']:9} | {data['games']:9}"
+                if self.settings.paired:
+                    line += f" | {data['pair_wins']:9} | {data['pair_draws']:9} | {data['pair_losses']:9}"
+                report.write(line + "\n")
+
+            for name, cache in (("Network", self.networks), ("Compiled network", self.compiled_networks)):
+                if cache.built or cache.reused:
+                    report.write(f"\n{name} cache: {cache.built} built, {cache.reused} reused, {len(cache)} held\n")
+
+            lookups = self.cache_hits + self.cache_misses
+            if lookups:
                 report.write(
-                    f"{genome_id:9} | {data['fitness']:5.3f} | {data['invalid_moves']:9} | {data['wins']:9} | {data['draws']:9} | {data['losses']:9}\n"
+                    f"\nActivation cache: {self.cache_hits} hits, {self.cache_misses} misses ({self.cache_hits / lookups:.1%} hit rate)\n"
                 )
+
+            if self.coordinator is not None:
+                report.write("\n")
+                for name, (games, seconds) in sorted(self.coordinator.stats.items()):
+                    if games:
+                        report.write(f"Worker {name}: {games} matchups in {seconds:.1f}s ({games / seconds:.1f} matchups/s)\n")
     
-    def save_genome(self, genome, genome_id, generation):
+    def save_genomes(self, genomes, generation):
         """
-        Saves a genome to a file for later use.
+        Checkpoints a whole generation to the genome store, writing only the
+        genomes that changed since earlier generations.
         """
-        os.makedirs(f"genomes/generation_{generation}/", exist_ok=True)
-        filename = f"genomes/generation_{generation}/genome_{genome_id}.pkl"
+        self.genome_store.save_generation(generation, genomes)
+
+    def load_genome(self, generation, genome_id):
+        """
+        Loads a single genome saved by save_genomes.
+        """
+        return self.genome_store.load_genome(generation, genome_id)
 
-        with open(filename, "wb") as genome_file:
-            pickle.dump(genome, genome_file)
-    
     def log_game(self, generation, game_number, genome1, genome2, log_data):
         """
-        Logs the details of a single game.
+        Logs the details of a single game as a binary record in
+        reports/generation_N.games (see read_games.py to view it).
         """
-        os.makedirs(f"reports/generation_{generation}/", exist_ok=True)
-        filename = f"reports/generation_{generation}/g{game_number} ({genome1.key},{genome2.key}).txt"
+        if not self.logger.should_log(game_number):
+            return
+        if self.profiler.enabled:
+            started = time.perf_counter()
 
-        with open(filename, "w") as log:
-            log.write(f"GENERATION {generation}\n")
-            log.write(f"GAME {game_number} - {genome1.key} vs {genome2.key}\n\n")
-            for ply, ply_data in enumerate(log_data["moves"], start=1):
-                log.write(
-                    f"Ply {ply} ({ply_data['invalid']}, {ply_data['alt_moves']}): {ply_data['move']}\n"
-                )
-            log.write("\n")
-            log.write(f"Game Over. {log_data['result']}.\n")
-            log.write(f"\t Light: {log_data['light']} ({log_data['fitness_1']}).\n")
-            log.write(f"\t Dark: {log_data['dark']} ({log_data['fitness_2']}).\n")
+        record = encode_game_record(generation, game_number, genome1.key, genome2.key, log_data, self.move_table)
+        self.logger.write(f"reports/generation_{generation}.games", (game_number, record), "record")
 
-            log.write("\n______ ______ ______ ______ ~|~ ______ |COLUMN GAME| ______ ~|~ ______ ______ ______ ______\n")
-            for level in reversed(range(log_data['game'].stack_height)):
-                row = []
-                for col_index, column in enumerate(log_data['game'].board):
-                    if level < len(column.stack):
-                        cell_content = column.stack[level]
-                    else:
-                        cell_content = "--"
-                    row.append(f"[ {cell_content:^3}]")
-                    if (col_index + 1) % 4 == 0 and col_index != 11:
-                        row.append("~|~")
-                log.write(" ".join(row) + "\n")  # Write each row to the file
-            log.write("\n")  # Add spacing for readability
+        if self.profiler.enabled:
+            self.profiler.lap("logging", started)
 
     def play_game(self, genome1, net1, genome2, net2, generation, game_number, log_data):
         """
         Plays a single game and logs details.
         """
-        game = ColumnsGame()
+        game = ColumnsGame(move_table=self.move_table)
         current_nets = [net1, net2]
+        cached = [isinstance(net, ActivationCache) for net in current_nets]
         current_genomes = [genome1, genome2]
         invalid_moves = [0, 0]
         fits = [0, 0]
         turn = 0
         last_move_pass = 0
+        inputs = self.inputs
+        book = self.opening_book if self.settings.opening_book_evaluation else None
+        profiling = self.profiler.enabled
 
-        with open("log.txt", 'a') as log:
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            log.write(f"[{current_time}] Game #: {game_number}\n")
-
-            while True:
-                current_player = game.current_player
-                net = current_nets[current_player]
-                genome = current_genomes[current_player]
-
+        while True:
+            current_player = game.current_player
+            net = current_nets[current_player]
+            genome = current_genomes[current_player]
+            if profiling:
+                started = time.perf_counter()
+
+            # Book moves are played as-is without consulting the network
+            book_move = book.choose(game.state) if book is not None and turn < book.plies else None
+            if book_move is not None and game.apply_move(book_move):
+                move_index = book_move
+                valid_move = 1
+            else:
                 # Encode game state and get AI's move
-                inputs = self.encode_state(game)
-                output = net.activate(inputs)
+                self.encode_state_into(game, inputs)
+                if profiling:
+                    started = self.profiler.lap("encode_state", started)
+                if cached[current_player]:
+                    output = net.activate(inputs, game.position_hash)
+                else:
+                    output = net.activate(inputs)
+                if profiling:
+                    started = self.profiler.lap("activate", started)
 
-                move_str = self.decode_output(output)
+                move_index = self.decode_move_index(output)
+                if profiling:
+                    started = self.profiler.lap("decode_output", started)
 
                 # Process the move
-                valid_move = game.process_move(move_str)
-                alt_moves = 0
+                valid_move = game.apply_move(move_index)
 
-                if valid_move:
-                    fits[current_player] += 0.10
-                else:
-                    fits[current_player] -= 0.10  # Penalize invalid moves
-                    invalid_moves[current_player] += 1
+            if profiling:
+                started = self.profiler.lap("process_move", started)
+
+            move_str = self.all_moves[move_index]
+            alt_moves = 0
 
+            if valid_move:
+                fits[current_player] += 0.10
+            else:
+                fits[current_player] -= 0.10  # Penalize invalid moves
+                invalid_moves[current_player] += 1
+
+                if self.settings.move_selection == "retry":
                     # Try alternative moves
-                    alts = self.next_nearest_move(move_str)
+                    alts = self.nearest_move_indices(move_index)
                     for a in alts:
-                        move_str = a
-                        res = game.process_move(move_str)
+                        move_str = self.all_moves[a]
+                        res = game.apply_move(a)
                         alt_moves += 1
                         if res:
                             break
                         else: 
                             move_str = "Pass"
                         fits[current_player] -= 0.001  # Penalize further invalid moves
+                else:
+                    alt_index, alt_moves = self.select_legal_move(game, output, move_index)
+                    if alt_index is None:
+                        move_str = "Pass"
+                    else:
+                        game.apply_move(alt_index)
+                        move_str = self.all_moves[alt_index]
 
-                log_data["moves"].append({
-                    "move": move_str,
-                    "invalid": int(not valid_move),
-                    "alt_moves": alt_moves,
-                })
+                    # Same penalty the retry loop gives each move it rejects on the way
+                    for _ in range(alt_moves - (alt_index is not None)):
+                        fits[current_player] -= 0.001
 
-                log.write(f"\t{turn} ({int(not valid_move)}, {alt_moves}): {move_str}\n")
+                if profiling:
+                    self.profiler.lap("next_nearest_move", started)
 
-                if move_str == "Pass":
-                    if last_move_pass:
-                        break
-                    else:
-                        last_move_pass = 1
-                else:
-                    last_move_pass = 0
+            log_data["moves"].append({
+                "move": move_str,
+                "invalid": int(not valid_move),
+                "alt_moves": alt_moves,
+            })
 
-                if all(value == 0 for value in game.pieces[game.players[game.current_player]].values()):
+            if move_str == "Pass":
+                if last_move_pass:
                     break
+                else:
+                    last_move_pass = 1
+            else:
+                last_move_pass = 0
 
-                game.current_player ^= 1
-                turn += 1
+            if all(value == 0 for value in game.pieces[game.players[game.current_player]].values()):
+                break
 
-                if turn >= 100:
-                    break
+            game.current_player ^= 1
+            turn += 1
+
+            if turn >= 100:
+                break
 
         isDraw = False
 
@@ -502,104 +3438,523 @@ class AiEngine:
             "game": game
         })
 
+        self.log_plies(game_number, log_data)
+
+        if profiling:
+            self.profiler.count("games")
+            self.profiler.count("plies", len(log_data["moves"]))
+            self.profiler.count("picks", len(log_data["moves"]))
+            self.profiler.count("invalid_moves", invalid_moves[0] + invalid_moves[1])
+
         return log_data
 
+    def update_results(self, results, genome_id1, genome_id2, result):
+        """
+        Adds the outcome of a single game to the per-genome results. Genomes
+        without an entry (reference opponents) are skipped.
+        """
+        if result["result"] == "Light Won":
+            outcomes = ["wins", "losses"]
+        elif result["result"] == "Dark Won":
+            outcomes = ["losses", "wins"]
+        else:
+            outcomes = ["draws", "draws"]
+
+        for side, genome_id in enumerate((genome_id1, genome_id2), start=1):
+            if genome_id not in results:
+                continue
+            results[genome_id][outcomes[side - 1]] += 1
+            results[genome_id]["fitness"] += result[f"fitness_{side}"]
+            results[genome_id]["invalid_moves"] += result[f"invalid_moves_{side}"]
+            results[genome_id]["games"] += 1
+
+    def update_pair_results(self, results, genome_id1, genome_id2, first, second):
+        """
+        Scores a paired match: genome_id1 played Light in the first leg and
+        Dark in the second. The matchup goes to whichever genome took more
+        points over both legs (1 per win, 0.5 per draw).
+        """
+        light_points = {"Light Won": 1, "Dark Won": 0, "Draw": 0.5}
+        points1 = light_points[first] + 1 - light_points[second]
+        points2 = 2 - points1
+
+        for genome_id, points, other in ((genome_id1, points1, points2), (genome_id2, points2, points1)):
+            if genome_id not in results:
+                continue
+            if points > other:
+                results[genome_id]["pair_wins"] += 1
+            elif points < other:
+                results[genome_id]["pair_losses"] += 1
+            else:
+                results[genome_id]["pair_draws"] += 1
+
+    def play_parallel(self, pairings, genome_map, config, results, first_game):
+        """
+        Plays pairings across a pool of worker processes.
+
+        Games are numbered as in the serial loop and merged back in that
+        order (see split_tasks and merge_games), so fitness sums come out
+        identical to a serial run.
+
+        Returns:
+            list: the result string of every pairing, in pairing order.
+        """
+        # A few tasks per worker keeps the pool busy when games vary in length
+        tasks = [
+            (self.generation, task_genomes, chunk)
+            for task_genomes, chunk in self.split_tasks(pairings, genome_map, config, first_game, self.settings.workers * 4)
+        ]
+
+        # The pool lives until train() ends, so workers keep their networks
+        if self.worker_pool is None:
+            self.worker_pool = multiprocessing.Pool(self.settings.workers, initializer=_init_worker, initargs=(self,))
+            atexit.register(self.worker_pool.terminate)  # When evaluating outside train()
+
+        games = []
+        for chunk_games, (hits, misses), profile in self.worker_pool.imap_unordered(_play_pairings, tasks):
+            games.extend(chunk_games)
+            self.cache_hits += hits
+            self.cache_misses += misses
+            self.profiler.merge(profile)
+
+        return self.merge_games(games, genome_map, results)
+
+    def play_distributed(self, pairings, genome_map, config, results, first_game):
+        """
+        Plays pairings on workers connected to this engine's
+        EvaluationCoordinator, which is started on first use.
+
+        Tasks of about distributed_task_games games are handed out as
+        workers become free, and merged back in game order like
+        play_parallel, so the fitness sums match a serial run.
+
+        Returns:
+            list: the result string of every pairing, in pairing order.
+        """
+        if self.coordinator is None:
+            self.coordinator = EvaluationCoordinator(
+                self, self.settings.coordinator_host, self.settings.coordinator_port, self.settings.local_workers
+            )
+
+        num_tasks = -(-len(pairings) // max(1, self.settings.distributed_task_games))
+        tasks = [
+            (self.generation, task_genomes, chunk)
+            for task_genomes, chunk in self.split_tasks(pairings, genome_map, config, first_game, num_tasks)
+        ]
+
+        games = []
+        for chunk_games, (hits, misses), profile in self.coordinator.play(tasks):
+            games.extend(chunk_games)
+            self.cache_hits += hits
+            self.cache_misses += misses
+            self.profiler.merge(profile)
+
+        return self.merge_games(games, genome_map, results)
+
+    def split_tasks(self, pairings, genome_map, config, first_game, num_tasks):
+        """
+        Numbers pairings from first_game and deals them into at most
+        num_tasks tasks. Both legs of a paired match go to the same task so
+        they share its networks.
+
+        Returns:
+            list: (genomes, chunk) per task, where genomes maps the genome
+            ids the task plays to their packed networks and chunk is a list of
+            (game_number, genome_id1, genome_id2).
+        """
+        numbered = [(first_game + n, genome_id1, genome_id2) for n, (genome_id1, genome_id2) in enumerate(pairings)]
+        legs = 2 if self.settings.paired else 1
+        matches = [numbered[n:n + legs] for n in range(0, len(numbered), legs)]
+
+        # Genomes travel packed (see encode_network), each packed once here
+        packed = {}
+        num_tasks = max(1, min(len(matches), num_tasks))
+        tasks = []
+        for t in range(num_tasks):
+            chunk = [game for match in matches[t::num_tasks] for game in match]
+            task_genomes = {}
+            for genome_id in sorted({genome_id for _, id1, id2 in chunk for genome_id in (id1, id2)}):
+                if genome_id not in packed:
+                    packed[genome_id] = encode_network(genome_map[genome_id], config)
+                task_genomes[genome_id] = packed[genome_id]
+            tasks.append((task_genomes, chunk))
+        return tasks
+
+    def merge_games(self, games, genome_map, results):
+        """
+        Applies games played elsewhere in game-number order, so fitness sums
+        are accumulated in the same sequence as the serial loop.
+
+        Returns:
+            list: the result string of every game, in game order.
+        """
+        games.sort(key=lambda game: game[0])
+        for _, genome_id1, genome_id2, result, records in games:
+            genome_map[genome_id1].fitness += result["fitness_1"]
+            genome_map[genome_id2].fitness += result["fitness_2"]
+            self.update_results(results, genome_id1, genome_id2, result)
+
+            for record in records:
+                self.logger.write(*record)
+
+        return [result["result"] for _, _, _, result, _ in games]
+
+    def play_lockstep(self, pairings, genome_map, config, results, first_game):
+        """
+        Plays pairings with LockstepSelfPlay, lockstep_games games at a time,
+        merging results in the same game order as the serial loop.
+
+        With workers > 1 each batch is split across a SharedSelfPlayPool,
+        which reads the networks and plays the games in shared memory.
+        """
+        used = {genome_id for pairing in pairings for genome_id in pairing}
+        nets = {genome_id: self.compiled_networks.get(genome_map[genome_id], config) for genome_id in used}
+        outcomes = []
+
+        pool = None
+        if self.settings.workers > 1:
+            if self.selfplay_pool is None:
+                self.selfplay_pool = SharedSelfPlayPool(self, self.settings.workers)
+            pool = self.selfplay_pool
+            pool.share_networks(list(nets.values()))
+            index = {genome_id: i for i, genome_id in enumerate(nets)}
+
+        # Keep both legs of a paired match in the same batch
+        legs = 2 if self.settings.paired else 1
+        batch_size = max(legs, self.settings.lockstep_games - self.settings.lockstep_games % legs)
+        for start in range(0, len(pairings), batch_size):
+            batch = pairings[start:start + batch_size]
+            games = None
+            if pool is not None:
+                games = SharedArrays.create(LockstepSelfPlay.array_specs(len(batch)))
+                LockstepSelfPlay.start_arrays(games.arrays, [[index[light], index[dark]] for light, dark in batch])
+                for profile in pool.play(games, legs):
+                    self.profiler.merge(profile)
+                selfplay = LockstepSelfPlay(self, nets, arrays=games.arrays)
+                batch_results = selfplay.results()
+            else:
+                used = {genome_id for pairing in batch for genome_id in pairing}
+                selfplay = LockstepSelfPlay(self, {genome_id: nets[genome_id] for genome_id in used}, batch)
+                batch_results = selfplay.run()
+
+            for g, result in enumerate(batch_results):
+                genome_id1, genome_id2 = batch[g]
+                genome1, genome2 = genome_map[genome_id1], genome_map[genome_id2]
+                genome1.fitness += result["fitness_1"]
+                genome2.fitness += result["fitness_2"]
+                self.update_results(results, genome_id1, genome_id2, result)
+                outcomes.append(result["result"])
+
+                # Rebuilding the game only pays off when it will be logged
+                game_number = first_game + start + g
+                if self.logger.should_log(game_number):
+                    game_log = selfplay.game_log(g)
+                    game_log.update(result)
+                    game_log.update({"light": genome1.key, "dark": genome2.key})
+                    self.log_plies(game_number, game_log)
+                    self.log_game(self.generation, game_number, genome1, genome2, game_log)
+
+            if games is not None:
+                del selfplay  # Its arrays are views onto the segment
+                games.close()
+
+        return outcomes
+
+    def play_serial(self, pairings, genome_map, config, results, first_game):
+        """
+        Plays pairings one after another in this process.
+        """
+        nets = {}
+        outcomes = []
+        for j, (genome_id1, genome_id2) in enumerate(pairings, start=first_game):
+            genome1 = genome_map[genome_id1]
+            genome2 = genome_map[genome_id2]
+
+            for genome_id in (genome_id1, genome_id2):
+                if genome_id not in nets:
+                    nets[genome_id] = self.networks.get(genome_map[genome_id], config)
+            net1 = nets[genome_id1]
+            net2 = nets[genome_id2]
+
+            game_log = {"moves": []}
+            result = self.play_game(
+                genome1,
+                net1,
+                genome2,
+                net2,
+                generation=self.generation,
+                game_number= j,
+                log_data=game_log,
+            )
+
+            self.update_results(results, genome_id1, genome_id2, result)
+            outcomes.append(result["result"])
+
+            # Log the game details
+            self.log_game(self.generation, j, genome1, genome2, game_log)
+
+        hits, misses = self.cache_stats(nets.values())
+        self.cache_hits += hits
+        self.cache_misses += misses
+        return outcomes
+
+    def play_pairings(self, pairings, genome_map, config, results, first_game):
+        """
+        Plays a list of (light genome id, dark genome id) pairings with the
+        configured backend, numbering games from first_game.
+
+        With paired set, each pairing is played twice in consecutive games,
+        the second time with colours swapped, and scored as a match as well.
+
+        Returns:
+            int: the number of games played.
+        """
+        if self.settings.paired:
+            legs = [leg for genome_id1, genome_id2 in pairings for leg in ((genome_id1, genome_id2), (genome_id2, genome_id1))]
+        else:
+            legs = pairings
+
+        if self.settings.distributed:
+            outcomes = self.play_distributed(legs, genome_map, config, results, first_game)
+        elif self.settings.lockstep:
+            outcomes = self.play_lockstep(legs, genome_map, config, results, first_game)
+        elif self.settings.workers > 1:
+            outcomes = self.play_parallel(legs, genome_map, config, results, first_game)
+        else:
+            outcomes = self.play_serial(legs, genome_map, config, results, first_game)
+
+        if self.settings.paired:
+            for n, (genome_id1, genome_id2) in enumerate(pairings):
+                self.update_pair_results(results, genome_id1, genome_id2, outcomes[2 * n], outcomes[2 * n + 1])
+
+        return len(legs)
+
+    def log_plies(self, game_number, log_data):
+        """
+        Appends a finished game's plies to log.txt.
+        """
+        if not self.logger.should_log(game_number):
+            return
+        if self.profiler.enabled:
+            started = time.perf_counter()
+
+        lines = [f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Game #: {game_number}\n"]
+        for turn, ply_data in enumerate(log_data["moves"]):
+            lines.append(f"\t{turn} ({ply_data['invalid']}, {ply_data['alt_moves']}): {ply_data['move']}\n")
+        self.logger.write("log.txt", "".join(lines))
+
+        if self.profiler.enabled:
+            self.profiler.lap("logging", started)
+
     def evaluate_genomes(self, genomes, config):
         results = {
-            genome_id: {"fitness": 0, "invalid_moves": 0, "wins": 0, "draws": 0, "losses": 0} for genome_id, _ in genomes
+            genome_id: {"fitness": 0, "invalid_moves": 0, "wins": 0, "draws": 0, "losses": 0, "games": 0}
+            for genome_id, _ in genomes
         }
+        if self.settings.paired:
+            for data in results.values():
+                data.update({"pair_wins": 0, "pair_draws": 0, "pair_losses": 0})
 
-        for genome_id, genome in genomes:
-            genome.fitness = 0  # Reset fitness
-        
-        with open("log.txt", 'a') as log:
+        self.cache_hits = 0
+        self.cache_misses = 0
+        if self.coordinator is not None:
+            self.coordinator.reset_stats()
+
+        if self.logger.enabled:
             current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            log.write(f"\n[{current_time}] GENERATION: {self.generation} ##### ##### ##### ##### #####\n\n")
-
-        j = 0
-        for i, (genome_id1, genome1) in enumerate(genomes):
-            for genome_id2, genome2 in genomes[i + 1:]:
-                net1 = neat.nn.FeedForwardNetwork.create(genome1, config)
-                net2 = neat.nn.FeedForwardNetwork.create(genome2, config)
-
-                game_log = {"moves": []}
-                result = self.play_game(
-                    genome1,
-                    net1,
-                    genome2,
-                    net2,
-                    generation=self.generation,
-                    game_number= j,
-                    log_data=game_log,
-                )
+            self.logger.write("log.txt", f"\n[{current_time}] GENERATION: {self.generation} ##### ##### ##### ##### #####\n\n")
 
-                # Update results
-                if result["result"] == "Light Won":
-                    results[genome_id1]["wins"] += 1
-                    results[genome_id2]["losses"] += 1
-                elif result["result"] == "Dark Won":
-                    results[genome_id2]["wins"] += 1
-                    results[genome_id1]["losses"] += 1
-                else:
-                    results[genome_id1]["draws"] += 1
-                    results[genome_id2]["draws"] += 1
+        # Reference opponents (e.g. a hall of fame) play but are not scored
+        genome_map = dict(genomes)
+        genome_map.update(self.scheduler.reference_genomes())
+        for genome in genome_map.values():
+            genome.fitness = 0  # Reset fitness
 
-                results[genome_id1]["fitness"] += result["fitness_1"]
-                results[genome_id2]["fitness"] += result["fitness_2"]
+        self.networks.update(genome_map)
+        self.compiled_networks.update(genome_map)
 
-                results[genome_id1]["invalid_moves"] += result["invalid_moves_1"]
-                results[genome_id2]["invalid_moves"] += result["invalid_moves_2"]
+        rng = random.Random(f"{self.settings.seed}-{self.generation}")
+        game_number = 0
+        for pairings in self.scheduler.rounds(genomes, results, rng):
+            game_number += self.play_pairings(pairings, genome_map, config, results, game_number)
 
-                # Log the game details
-                self.log_game(self.generation, j, genome1, genome2, game_log)
-                j += 1
+        if self.settings.normalise_fitness:
+            for genome_id, genome in genomes:
+                genome.fitness /= max(1, results[genome_id]["games"])
 
+        self.scheduler.end_generation(genomes)
 
         # Write the generation report
         self.write_generation_report(genomes, self.generation, results)
 
         # Save genomes for later use
-        for genome_id, genome in genomes:
-            self.save_genome(genome, genome_id, self.generation)
+        if self.profiler.enabled:
+            started = time.perf_counter()
+        self.save_genomes(genomes, self.generation)
+        if self.profiler.enabled:
+            self.profiler.lap("save_genome", started)
         
         self.generation += 1
     
-    def train(self, generations=25):
+    def train(self, generations=25, checkpoint_every=None, checkpoint_dir="checkpoints", checkpoint_keep=3):
         """
-        Trains the population over the specified number of generations.
+        Trains the population over the specified number of generations,
+        checkpointing every checkpoint_every generations if set.
         """
-        winner = self.population.run(self.evaluate_genomes, generations)
+        checkpointer = None
+        if checkpoint_every:
+            checkpointer = TrainingCheckpointer(self, checkpoint_dir, checkpoint_every, checkpoint_keep)
+            self.population.add_reporter(checkpointer)
+
+        try:
+            winner = self.population.run(self.evaluate_genomes, generations)
+        finally:
+            if checkpointer is not None:
+                checkpointer.flush()
+                self.population.remove_reporter(checkpointer)
+            if self.worker_pool is not None:
+                self.worker_pool.close()
+                self.worker_pool.join()
+                self.worker_pool = None
+            if self.coordinator is not None:
+                self.coordinator.close()
+                self.coordinator = None
+            if self.selfplay_pool is not None:
+                self.selfplay_pool.close()
+                self.selfplay_pool = None
+        self.logger.flush()
         print("\nBest genome:\n", winner)
 
-    def play(self, game):
+    def training_state(self, next_generation):
+        """
+        Everything train() needs to carry on from next_generation exactly as
+        an uninterrupted run would: the population, species, reproduction
+        and node-key counters, innovation tracker, best genome, statistics,
+        pairing scheduler, this engine's generation and the Python and NumPy
+        random states.
+        """
+        reproduction = self.population.reproduction
+        genome_config = self.config.genome_config
+        next_genome_key, reproduction.genome_indexer = split_counter(reproduction.genome_indexer)
+        next_node_key = None
+        if genome_config.node_indexer is not None:
+            next_node_key, genome_config.node_indexer = split_counter(genome_config.node_indexer)
+
+        # The species set links back to the reporters, which are not saved
+        species = self.population.species
+        reporters, species.reporters = species.reporters, None
+        try:
+            return {
+                "version": 1,
+                "generation": next_generation,
+                "engine_generation": self.generation,
+                "population": self.population.population,
+                "species": copy.copy(species),
+                "ancestors": reproduction.ancestors,
+                "next_genome_key": next_genome_key,
+                "next_node_key": next_node_key,
+                "innovation_tracker": reproduction.innovation_tracker,
+                "best_genome": self.population.best_genome,
+                "stats": (self.stats.most_fit_genomes, self.stats.generation_statistics),
+                "scheduler": self.scheduler,
+                "random_state": random.getstate(),
+                "numpy_random_state": np.random.get_state(),
+            }
+        finally:
+            species.reporters = reporters
+
+    def resume(self, checkpoint):
+        """
+        Continues from a checkpoint written during train(). checkpoint is a
+        checkpoint file or a directory, in which case its latest checkpoint
+        is used.
         """
-        Plays a single game using the best-trained genome.
+        if os.path.isdir(checkpoint):
+            found = TrainingCheckpointer.checkpoints(checkpoint)
+            if not found:
+                raise FileNotFoundError(f"No checkpoints in {checkpoint}.")
+            checkpoint = found[-1][1]
+        state = TrainingCheckpointer.load(checkpoint)
+
+        self.population = neat.Population(self.config, (state["population"], state["species"], state["generation"]))
+        reproduction = self.population.reproduction
+        reproduction.ancestors = state["ancestors"]
+        reproduction.genome_indexer = itertools.count(state["next_genome_key"])
+        reproduction.innovation_tracker = state["innovation_tracker"]
+        self.config.genome_config.innovation_tracker = state["innovation_tracker"]
+        if state["next_node_key"] is not None:
+            self.config.genome_config.node_indexer = itertools.count(state["next_node_key"])
+        self.population.best_genome = state["best_genome"]
+
+        self.add_reporters()
+        self.stats.most_fit_genomes, self.stats.generation_statistics = state["stats"]
+        self.scheduler = state["scheduler"]
+        self.generation = state["engine_generation"]
+
+        random.setstate(state["random_state"])
+        np.random.set_state(state["numpy_random_state"])
+        print(f"Resuming from {checkpoint} at generation {state['generation']}")
+
+    def play(self, game, genome=None):
+        """
+        Plays a game using the best-trained genome (or the given one) for both
+        sides. Positions in the opening book are played from the book. Other
+        moves come from a SearchPlayer given search_time seconds when search
+        is alphabeta or mcts; with none the network's top pick is played,
+        falling back to its best legal move.
         """
         # Load the best genome
-        best_genome = self.population.best_genome()
-        net = neat.nn.FeedForwardNetwork.create(best_genome, self.config)
+        if genome is None:
+            genome = self.stats.best_genome()
+        net = self.create_network(genome, self.config)
+
+        tablebase = Tablebase.load(self.settings.tablebase) if self.settings.tablebase else None
+        player = None
+        if self.settings.search != "none":
+            player = SearchPlayer(self, net, self.settings.search, self.settings.search_time, tablebase=tablebase)
 
+        book = self.opening_book
+        turn = 0
+        passes = 0
         while True:
             # Display the board
             game.display_board()
 
-            # Encode the current game state
-            inputs = self.encode_state(game)
-
-            # Get the network's output
-            output = net.activate(inputs)
+            book_move = book.choose(game.state) if book is not None and turn < book.plies else None
+            searched = False
+            if book_move is not None and legal_moves(game, self.move_table)[book_move]:
+                move_index = book_move
+            elif player is not None:
+                move_index = player.choose(game, turn)
+                searched = True
+            else:
+                output = net.activate(self.encode_state(game))
+                move_index = self.decode_move_index(output)
+                if not legal_moves(game, self.move_table)[move_index]:
+                    move_index, _ = self.select_legal_move(game, np.asarray(output), move_index)
+
+            mover = game.current_player
+            if move_index is None:
+                print("AI Move: Pass")
+                passes += 1
+            else:
+                print(f"AI Move: {self.all_moves[move_index]}")
+                game.apply_move(move_index)
+                passes = 0
 
-            # Decode the output into a move
-            move_str = self.decode_output(output)
-            print(f"AI Move: {move_str}")
+            if move_index is not None and move_index == book_move:
+                print("\t(opening book)")
+            elif searched:
+                print(f"\t{player.nodes} nodes in {player.elapsed:.2f}s ({player.nodes_per_second:.0f} nodes/s)")
 
-            # Process the move
-            if not game.process_move(move_str):
-                print("Invalid move by AI.")
+            # Check if the game has ended
+            if passes >= 2 or all(value == 0 for value in game.pieces[game.players[mover]].values()):
+                print("Game Over.")
                 break
 
-            # Check if the game has ended
-            if all(value == 0 for value in game.pieces[game.players[game.current_player]].values()):
+            game.current_player ^= 1
+            turn += 1
+            if turn >= SearchPlayer.max_turns:
                 print("Game Over.")
                 break
 
@@ -608,9 +3963,75 @@ def LogicEngine():
         self.game = "game"
 
 
-def main():
-    ai = AiEngine('C:\\Users\\brayd\\Builds\\Games\\columns-game\\config_file.txt') #CHANGE ME TO RUN
-    ai.train(generations=100)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train Columns players with NEAT self-play.")
+    parser.add_argument("--config", help="NEAT config file (default: $COLUMNS_CONFIG, else config_file.txt "
+                                         "in the working directory, else next to main.py)")
+    parser.add_argument("--moves", help="moves file (default: moves.txt in the working directory, else next to main.py)")
+    parser.add_argument("--output-dir", default=".", help="directory for reports, genomes, logs and checkpoints")
+    parser.add_argument("--generations", type=int, default=100, help="generations to train (more, when resuming)")
+    parser.add_argument("--workers", type=int, help="worker processes (overrides [Evaluation] workers)")
+    parser.add_argument("--seed", type=int, help="seed for Python, NumPy and the pairing schedules")
+    parser.add_argument("--log-verbosity", choices=["off", "sampled", "full"], help="game logging level")
+    parser.add_argument("--log-sample-every", type=int, help="with sampled logging, log every Nth game")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="override any [Evaluation] setting; may be repeated")
+    parser.add_argument("--checkpoint-every", type=int, help="save a checkpoint every N generations")
+    parser.add_argument("--checkpoint-dir", default="checkpoints",
+                        help="checkpoint directory, relative to the output directory")
+    parser.add_argument("--checkpoint-keep", type=int, default=3, help="newest checkpoints to keep")
+    parser.add_argument("--resume", metavar="CHECKPOINT",
+                        help="checkpoint file, or directory whose latest checkpoint is used, to continue training from")
+    parser.add_argument("--worker", metavar="HOST:PORT",
+                        help="play evaluation tasks for the coordinator at HOST:PORT instead of training")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.worker:
+        # Run the worker from the importable module rather than __main__, so
+        # the classes it builds are the ones the coordinator's engine uses
+        import main as columns
+        host, port = args.worker.rsplit(":", 1)
+        columns.run_worker(host, int(port))
+        return 0
+
+    # Resolve inputs before moving into the output directory
+    config_file = os.path.abspath(find_data_file(CONFIG_FILE, args.config or os.environ.get("COLUMNS_CONFIG")))
+    moves_file = os.path.abspath(find_data_file(MOVES_FILE, args.moves))
+    resume_file = os.path.abspath(args.resume) if args.resume else None
+
+    overrides = dict(setting.split("=", 1) for setting in args.set)
+    for name, value in (("workers", args.workers), ("seed", args.seed),
+                        ("log_verbosity", args.log_verbosity), ("log_sample_every", args.log_sample_every)):
+        if value is not None:
+            overrides[name] = str(value)
+
+    # Input files must still be found after moving into the output
+    # directory: --set paths are relative to where we were started, config
+    # file paths to the config file
+    settings = EvaluationSettings(config_file)
+    for name in EvaluationSettings.input_paths:
+        if name in overrides:
+            value, base = overrides[name], os.getcwd()
+        else:
+            value, base = getattr(settings, name), os.path.dirname(config_file)
+        if value:
+            overrides[name] = os.path.abspath(os.path.join(base, value))
+
+    if args.seed is not None:
+        random.seed(args.seed)
+        np.random.seed(args.seed)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    os.chdir(args.output_dir)
+
+    ai = AiEngine(config_file, moves_file, overrides)
+    if resume_file:
+        ai.resume(resume_file)
+    ai.train(generations=args.generations, checkpoint_every=args.checkpoint_every,
+             checkpoint_dir=args.checkpoint_dir, checkpoint_keep=args.checkpoint_keep)
+    return 0
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    sys.exit(main())
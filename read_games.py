@@ -0,0 +1,39 @@
+"""
+Prints games from a generation's binary game records.
+
+Usage:
+    python read_games.py reports/generation_3.games            # list games
+    python read_games.py reports/generation_3.games 120 [121]  # show games
+"""
+import argparse
+
+from main import GameRecordFile
+
+def print_game(log_data):
+    print(f"GENERATION {log_data['generation']}")
+    print(f"GAME {log_data['game_number']} - {log_data['light']} vs {log_data['dark']}\n")
+    for ply, ply_data in enumerate(log_data["moves"], start=1):
+        print(f"Ply {ply} ({ply_data['invalid']}, {ply_data['alt_moves']}): {ply_data['move']}")
+    print("")
+    print(f"Game Over. {log_data['result']}.")
+    print(f"\t Light: {log_data['light']} ({log_data['fitness_1']}).")
+    print(f"\t Dark: {log_data['dark']} ({log_data['fitness_2']}).")
+    log_data["game"].display_board()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("records", help=".games file to read")
+    parser.add_argument("games", nargs="*", type=int, help="game numbers to show (default: list the games)")
+    args = parser.parse_args()
+
+    records = GameRecordFile(args.records)
+    if not args.games:
+        game_numbers = records.game_numbers()
+        print(f"{len(game_numbers)} games: {', '.join(str(n) for n in game_numbers)}")
+        return
+
+    for game_number in args.games:
+        print_game(records.read(game_number))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Checks ColumnsGame's compact state against the original rules and its
+incremental Zobrist hash against a from-scratch recomputation.
+
+Usage:
+    python -m pytest test_game_state.py
+"""
+import random
+
+import numpy as np
+
+from main import ColumnsGame, get_move_table, legal_moves, restricted_neighbors
+
+MOVE_TABLE = get_move_table()
+
+class BaselineGame:
+    """
+    The original list-of-strings board and its move rules, kept as the
+    reference process_move must agree with.
+    """
+    def __init__(self, game):
+        self.stacks = [list(column.stack) for column in game.board]
+        self.players = list(game.players)
+        self.pieces = {player: dict(game.pieces[player]) for player in self.players}
+        self.current_player = game.current_player
+        self.score = list(game.score)
+
+    def process_move(self, move_str):
+        try:
+            parts = move_str.split(",")
+            move_type = parts[0].strip().lower()
+            cols = [int(col.strip()) - 1 for col in parts[1:]]
+            if move_type not in ['r', 'b']:
+                return 0
+            if any(col < 0 or col > 11 for col in cols):
+                return 0
+            if any(len(self.stacks[col]) >= 5 for col in cols):
+                return 0
+            if move_type == 'r':
+                if len(cols) != 1:
+                    return 0
+                return 1 if self.place_roundel(cols[0]) else 0
+            elif move_type == 'b':
+                if len(cols) not in [1, 2, 3]:
+                    return 0
+                return 1 if self.place_blocker(cols) else 0
+        except (ValueError, IndexError):
+            return 0
+
+    def place_roundel(self, col):
+        pieces = self.pieces[self.players[self.current_player]]
+        if pieces["roundels"] < 1:
+            return 0
+        piece = "Dr" if self.current_player else "Lr"
+        blocker = "Lb" if self.current_player else "Db"
+        if self.stacks[col] and self.stacks[col][-1] == blocker:
+            return 0
+        self.stacks[col].append(piece)
+        pieces["roundels"] -= 1
+        if len(self.stacks[col]) == 5:
+            self.score[self.current_player] += 1
+        return 1
+
+    def place_blocker(self, cols):
+        sizes = [len(self.stacks[col]) for col in cols]
+        if len(cols) == 1:
+            piece_type = "blockers"
+        elif len(cols) == 2:
+            piece_type = "d-blockers"
+            if cols[0] == cols[1] or sizes[0] != sizes[1] or cols[0] not in restricted_neighbors(cols[1]):
+                return 0
+        else:
+            piece_type = "l-blockers"
+            if sum(sizes) >= 11:
+                return 0
+            if not (
+                (cols[0] == cols[1] and cols[0] in restricted_neighbors(cols[2]) and sizes[2] - sizes[0] in (0, 1)) or
+                (cols[1] == cols[2] and cols[1] in restricted_neighbors(cols[0]) and sizes[0] - sizes[1] in (0, 1)) or
+                (cols[2] == cols[0] and cols[2] in restricted_neighbors(cols[1]) and sizes[1] - sizes[2] in (0, 1))
+            ):
+                return 0
+
+        pieces = self.pieces[self.players[self.current_player]]
+        if pieces[piece_type] < 1:
+            return 0
+        piece = "Db" if self.current_player else "Lb"
+        for col in cols:
+            self.stacks[col].append(piece)
+        pieces[piece_type] -= 1
+        return 1
+
+def random_games(count, seed):
+    """
+    Yields seeded games as they progress: every position of count random
+    legal games, each advanced one move after it is yielded.
+    """
+    rng = random.Random(seed)
+    for _ in range(count):
+        game = ColumnsGame(move_table=MOVE_TABLE)
+        passes = 0
+        while passes < 2:
+            yield game, rng
+            legal = np.flatnonzero(legal_moves(game))
+            if len(legal) == 0:
+                passes += 1
+            else:
+                game.apply_move(int(rng.choice(legal)))
+                passes = 0
+            game.current_player ^= 1
+
+def test_process_move_matches_baseline():
+    for game, _ in random_games(30, seed=1):
+        for move in MOVE_TABLE.texts:
+            baseline = BaselineGame(game)
+            played = game.clone()
+            assert played.process_move(move) == baseline.process_move(move), move
+            assert [column.stack for column in played.board] == baseline.stacks
+            assert {player: dict(played.pieces[player]) for player in played.players} == baseline.pieces
+            assert list(played.score) == baseline.score
+
+def test_apply_move_keeps_hash():
+    for game, _ in random_games(30, seed=2):
+        assert game.zobrist_hash == game.compute_hash()
+
+def test_make_undo_keeps_hash():
+    for game, rng in random_games(20, seed=3):
+        before = game.zobrist_hash
+        for move_index in rng.sample(range(len(MOVE_TABLE)), 10):
+            record = game.make_move(move_index)
+            assert game.zobrist_hash == game.compute_hash()
+            if record is not None:
+                game.undo_move(record)
+            assert game.zobrist_hash == before == game.compute_hash()
+
+def test_process_move_keeps_hash():
+    for game, rng in random_games(20, seed=4):
+        played = game.clone()
+        for move in rng.sample(MOVE_TABLE.texts, 10):
+            played.process_move(move)
+            assert played.zobrist_hash == played.compute_hash()
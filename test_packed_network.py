@@ -0,0 +1,45 @@
+"""
+Checks that networks packed with encode_network give the same outputs as
+the genomes they came from.
+
+Usage:
+    python -m pytest test_packed_network.py
+"""
+import random
+
+import neat
+import numpy as np
+
+from main import CONFIG_FILE, CompiledNetwork, decode_network, encode_network, find_data_file
+
+def mutated_genomes(config, count, seed):
+    # The population sets up the innovation tracker that mutation needs
+    random.seed(seed)
+    genomes = list(neat.Population(config).population.values())[:count]
+    for genome in genomes:
+        for _ in range(30):
+            genome.mutate(config.genome_config)
+    return genomes
+
+def test_round_trip_activations_unchanged():
+    config = neat.Config(
+        neat.DefaultGenome,
+        neat.DefaultReproduction,
+        neat.DefaultSpeciesSet,
+        neat.DefaultStagnation,
+        find_data_file(CONFIG_FILE),
+    )
+    rng = np.random.default_rng(0)
+    states = rng.integers(0, 13, size=(40, len(config.genome_config.input_keys))).astype(np.float64)
+
+    for genome in mutated_genomes(config, 4, seed=0):
+        expected = np.array([neat.nn.FeedForwardNetwork.create(genome, config).activate(state) for state in states])
+        data = encode_network(genome, config)
+
+        packed = decode_network(data)
+        assert packed.key == genome.key
+        feed_forward = packed.feed_forward(config.genome_config)
+        assert np.array_equal(np.array([feed_forward.activate(state) for state in states]), expected)
+
+        compiled = CompiledNetwork.from_bytes(data, config.genome_config.activation_defs)
+        assert np.allclose(compiled.activate_batch(states), expected, rtol=0, atol=1e-12)